@@ -1,15 +1,73 @@
-from flask import Flask, render_template, request, jsonify, send_file
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
 import traceback
 import os
 import json
+import threading
 from datetime import datetime
 import pytz
 from log_analyzer import LogAnalyzer
+from query_backend import QueryError
+from partial_aggregates import PartialAggregate, merge_partials
+from fleet import parse_peers, fan_out
+from report_scheduler import ReportScheduler, parse_ranges
+from sampling import parse_rates, DEFAULT_BLOCK_SIZE
+from timeseries_store import parse_step
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
 
-# 初始化LOG分析器
-analyzer = LogAnalyzer()
+# 初始化LOG分析器（QUERY_BACKEND=sqlite 時啟用嵌入式查詢後端）
+analyzer = LogAnalyzer(
+    log_dir=os.environ.get('LOG_DIR', '/app/logs'),
+    output_dir=os.environ.get('OUTPUT_DIR', '/app/output'),
+    query_backend=os.environ.get('QUERY_BACKEND') or None,
+    log_format=os.environ.get('LOG_FORMAT') or None,
+    log_format_style=os.environ.get('LOG_FORMAT_STYLE', 'nginx'),
+    route_rules=os.environ.get('ROUTE_RULES') or None,
+    url_query_mode=os.environ.get('URL_QUERY_MODE', 'mask'),
+    ip_database=os.environ.get('IP_DATABASE') or None,
+    timeseries=os.environ.get('TIMESERIES', '0') == '1',
+    timeseries_retention=os.environ.get('TIMESERIES_RETENTION') or None
+)
+
+# 跨主機彙總：其他節點的 base URL（逗號分隔）
+PEER_NODES = parse_peers(os.environ.get('PEER_NODES'))
+PEER_TIMEOUT = float(os.environ.get('PEER_TIMEOUT', '30'))
+
+# 預先產生的報表：REPORT_SCHEDULE=1 時於背景定期產生，首頁直接讀取最新發布版本
+report_scheduler = ReportScheduler(
+    analyzer,
+    ranges=parse_ranges(os.environ.get('REPORT_RANGES', '1h,1d,7d')),
+    interval=int(os.environ.get('REPORT_INTERVAL', '300')),
+    keep=int(os.environ.get('REPORT_KEEP', '3')),
+    charts=os.environ.get('REPORT_CHARTS', '1') == '1'
+)
+
+CATALOG_POLL_INTERVAL = float(os.environ.get('CATALOG_POLL_INTERVAL', '10'))
+
+def start_catalog_watcher():
+    """啟動檔案目錄輪詢（CATALOG_POLL_INTERVAL=0 時停用；重複呼叫不會建立第二個執行緒）"""
+    if CATALOG_POLL_INTERVAL > 0:
+        analyzer.catalog.start(CATALOG_POLL_INTERVAL)
+
+def start_report_scheduler():
+    """啟動報表排程（重複呼叫不會建立第二個執行緒）"""
+    report_scheduler.start()
+
+# 啟動耗時（模組載入到 app 就緒），於 /health 回報
+STARTUP_SECONDS = None
+WARM_UP_STATE = {'modules': False, 'charts': False}
+
+def warm_up(charts: bool = True):
+    """預熱分析/繪圖模組（gunicorn 預載與 fork 後的 hook 會呼叫，見 gunicorn.conf.py）"""
+    try:
+        analyzer.warm_up(charts=charts)
+        WARM_UP_STATE['modules'] = True
+        WARM_UP_STATE['charts'] = WARM_UP_STATE['charts'] or charts
+    except Exception as e:
+        print(f"預熱失敗: {e}")
 
 # 設定版本時間（台北時間）- 每次上版時更新
 taipei_tz = pytz.timezone('Asia/Taipei')
@@ -19,13 +77,17 @@ VERSION_TIME = datetime.now(taipei_tz).strftime('%Y-%m-%d %H:%M')
 def index():
     """主頁面"""
     try:
-        # 載入最新分析結果
-        results_file = os.path.join(analyzer.output_dir, 'analysis_results.json')
-        if os.path.exists(results_file):
-            with open(results_file, 'r', encoding='utf-8') as f:
-                stats = json.load(f)
+        # 優先使用排程預先產生的最新報表，否則載入最近一次手動分析結果
+        report = report_scheduler.latest(request.args.get('range'))
+        if report:
+            stats = report.get('basic_stats', {})
         else:
-            stats = {}
+            results_file = os.path.join(analyzer.output_dir, 'analysis_results.json')
+            if os.path.exists(results_file):
+                with open(results_file, 'r', encoding='utf-8') as f:
+                    stats = json.load(f)
+            else:
+                stats = {}
         
         return render_template('base.html', stats=stats, current_time=VERSION_TIME)
     except Exception as e:
@@ -47,6 +109,43 @@ def get_stats():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/stats/sampled')
+def get_sampled_stats():
+    """取樣估計基本統計（含取樣率與 95% 誤差範圍）
+
+    stream=1 時以 NDJSON 逐行回傳：先回傳低取樣率的快速估計，之後每擴大一次樣本更新一次。
+    """
+    try:
+        args = dict(
+            filename=request.args.get('filename'),
+            start_time=request.args.get('start_time'),
+            end_time=request.args.get('end_time'),
+            domain=request.args.get('domain'),
+            block_size=int(request.args.get('block_size', DEFAULT_BLOCK_SIZE))
+        )
+        if request.args.get('stream') != '1':
+            rates = parse_rates(request.args.get('rate') or '0.05')
+            if len(rates) != 1:
+                raise ValueError('rate 只能指定一個取樣率（逐步精化請用 stream=1 與 rates）')
+            return jsonify(analyzer.get_sampled_stats(rate=rates[0], **args))
+
+        rates = parse_rates(request.args.get('rates'))
+        target_error = request.args.get('target_error')
+        target_error = float(target_error) if target_error else None
+
+        def generate():
+            try:
+                for estimate in analyzer.iter_sampled_stats(rates=rates, target_error=target_error, **args):
+                    yield json.dumps(estimate, ensure_ascii=False) + '\n'
+            except Exception as e:
+                yield json.dumps({'error': str(e)}, ensure_ascii=False) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/hourly')
 def get_hourly():
     """取得每小時流量"""
@@ -62,6 +161,31 @@ def get_hourly():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/traffic/series')
+def get_traffic_series():
+    """任意區間與級距的流量趨勢（step 例如 60、5m、1h、1d；未指定時依 max_points 自動選擇）"""
+    try:
+        return jsonify(analyzer.get_traffic_series(
+            filename=request.args.get('filename'),
+            start_time=request.args.get('start_time'),
+            end_time=request.args.get('end_time'),
+            domain=request.args.get('domain'),
+            step=parse_step(request.args.get('step')),
+            max_points=int(request.args.get('max_points', 2000))
+        ))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/traffic/levels')
+def get_traffic_levels():
+    """時序各層級的資料點數、首末時間與保留期間"""
+    try:
+        if analyzer.timeseries is None:
+            return jsonify({'error': '未啟用時序（設定 TIMESERIES=1）'}), 400
+        return jsonify(analyzer.timeseries.levels())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/anomalies')
 def get_anomalies():
     """取得異常檢測結果"""
@@ -77,6 +201,52 @@ def get_anomalies():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/latency')
+def get_latency():
+    """取得延遲百分位（整體 / 依 URL / 依時間桶）"""
+    try:
+        latency = analyzer.get_latency_percentiles(
+            request.args.get('filename'),
+            request.args.get('start_time'),
+            request.args.get('end_time'),
+            request.args.get('domain'),
+            field=request.args.get('field', 'request_time'),
+            bucket_seconds=int(request.args.get('bucket_seconds', 3600)),
+            top_n=int(request.args.get('top_n', 20))
+        )
+        return jsonify(latency)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/ip-breakdown')
+def get_ip_breakdown():
+    """依國家 / ASN / 網段彙總請求（需設定 IP_DATABASE 才有國家與 ASN）"""
+    try:
+        breakdown = analyzer.get_ip_breakdown(
+            request.args.get('filename'),
+            request.args.get('start_time'),
+            request.args.get('end_time'),
+            request.args.get('domain'),
+            top_n=int(request.args.get('top_n', 20))
+        )
+        return jsonify(breakdown)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/error-templates')
+def get_error_templates():
+    """取得 error 訊息樣板排行（次數、最早/最晚出現、範例記錄）"""
+    try:
+        templates = analyzer.get_error_templates(
+            request.args.get('filename'),
+            request.args.get('start_time'),
+            request.args.get('end_time'),
+            top_n=int(request.args.get('top_n', 50))
+        )
+        return jsonify(templates)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/analyze', methods=['POST'])
 def run_analysis():
     """執行完整分析"""
@@ -92,6 +262,8 @@ def run_analysis():
         end_time = data.get('end_time')
         domain = data.get('domain')
         time_interval = data.get('time_interval', 'daily')
+        export_format = data.get('export_format')
+        source = data.get('source', 'logs')
         
         # 執行完整分析
         results = analyzer.run_full_analysis(
@@ -99,7 +271,9 @@ def run_analysis():
             start_time=start_time,
             end_time=end_time,
             domain=domain,
-            time_interval=time_interval
+            time_interval=time_interval,
+            export_format=export_format,
+            source=source
         )
         
         return jsonify({
@@ -109,6 +283,60 @@ def run_analysis():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e), 'trace': traceback.format_exc()}), 500
 
+@app.route('/api/partial')
+def get_partial():
+    """取得本節點的可合併部分統計"""
+    try:
+        partial = analyzer.get_partial_aggregate(
+            request.args.get('filename'),
+            request.args.get('start_time'),
+            request.args.get('end_time'),
+            request.args.get('domain')
+        )
+        return jsonify(partial)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/fleet/stats')
+def get_fleet_stats():
+    """協調節點：平行查詢所有 PEER_NODES 並與本機部分統計合併"""
+    try:
+        params = {k: request.args.get(k) for k in ('filename', 'start_time', 'end_time', 'domain')}
+        nodes = [{'node': 'local', 'ok': True, 'data': analyzer.get_partial_aggregate(**params)}]
+        nodes += fan_out(PEER_NODES, '/api/partial', params, timeout=PEER_TIMEOUT)
+
+        partials = []
+        for node in nodes:
+            data = node.get('data')
+            if node['ok'] and isinstance(data, dict) and 'unique_ips' in data:
+                partials.append(data)
+            elif node['ok']:
+                node.update(ok=False, error=(data or {}).get('error', 'invalid partial'))
+        stats = merge_partials(partials).finalize() if partials else PartialAggregate().finalize()
+        stats['nodes'] = [
+            {'node': n['node'], 'ok': n['ok'], 'total_requests': n['data'].get('total_requests') if n['ok'] else None,
+             'error': n.get('error')}
+            for n in nodes
+        ]
+        return jsonify(stats)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/query', methods=['POST'])
+def run_query():
+    """對查詢後端執行唯讀 SQL"""
+    try:
+        data = request.get_json() or {}
+        max_rows = min(int(data.get('max_rows', 1000)), 10000)
+        result = analyzer.run_query(data.get('sql', ''), data.get('params'), max_rows=max_rows)
+        return jsonify({'success': True, **result})
+    except QueryError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/chart/<filename>')
 def get_chart(filename):
     """取得圖表檔案"""
@@ -121,6 +349,47 @@ def get_chart(filename):
     except Exception as e:
         return f"錯誤: {str(e)}", 500
 
+@app.route('/api/reports')
+def list_reports():
+    """列出各報表區間的最新版本與上次排程執行結果"""
+    return jsonify({
+        'ranges': [{'range': name, 'seconds': seconds, 'version': report_scheduler.latest_version(name)}
+                   for name, seconds in report_scheduler.ranges],
+        'interval': report_scheduler.interval,
+        'last_run': report_scheduler.last_run
+    })
+
+@app.route('/api/reports/<name>')
+def get_report(name):
+    """取得指定區間最新發布的報表（含圖表網址）"""
+    try:
+        report = report_scheduler.latest(name)
+        if not report:
+            return jsonify({'error': '尚無此區間的報表'}), 404
+        report['chart_urls'] = [f"/api/reports/{name}/{report['version']}/{c}" for c in report.get('charts', [])]
+        return jsonify(report)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/reports/<name>/<version>/<filename>')
+def get_report_file(name, version, filename):
+    """取得已發布報表版本中的檔案（版本目錄發布後不再變動）"""
+    try:
+        path = os.path.join(report_scheduler.version_dir(name, version), os.path.basename(filename))
+    except ValueError:
+        return "報表檔案不存在", 404
+    if os.path.exists(path):
+        return send_file(path)
+    return "報表檔案不存在", 404
+
+@app.route('/api/reports/run', methods=['POST'])
+def run_reports():
+    """立即產生所有區間的報表"""
+    try:
+        return jsonify({'success': True, 'ranges': report_scheduler.run_once()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/health')
 def health_check():
     """健康檢查"""
@@ -128,27 +397,17 @@ def health_check():
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'log_dir': analyzer.log_dir,
-        'output_dir': analyzer.output_dir
+        'output_dir': analyzer.output_dir,
+        'startup_seconds': STARTUP_SECONDS,
+        'warmed_up': WARM_UP_STATE
     })
 
 @app.route('/api/logs/files')
 def list_log_files():
     """列出可用的LOG檔案"""
     try:
-        log_files = []
-        if os.path.exists(analyzer.log_dir):
-            for file in os.listdir(analyzer.log_dir):
-                if file.endswith('.log') or file.endswith('.error.log') or file.endswith('.err') or file.endswith('.error'):
-                    file_path = os.path.join(analyzer.log_dir, file)
-                    file_size = os.path.getsize(file_path)
-                    # 依副檔名粗略判斷類型
-                    f_lower = file.lower()
-                    ftype = 'error' if (f_lower.endswith('.error.log') or f_lower.endswith('.err') or f_lower.endswith('.error')) else 'access'
-                    log_files.append({
-                        'filename': file,
-                        'size': file_size,
-                        'type': ftype
-                    })
+        # 由檔案目錄提供（含格式、編碼、首末時間與行數）；輪詢執行緒運作中時不需重新掃描目錄
+        log_files = analyzer.catalog.files()
         return jsonify({'log_files': log_files})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -188,5 +447,18 @@ def get_logs():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+STARTUP_SECONDS = round(time.perf_counter() - _IMPORT_STARTED, 3)
+
+if os.environ.get('WARM_UP') == '1':
+    # 非 gunicorn 啟動（例如 flask run）時的選用預熱，於背景執行不阻塞就緒
+    threading.Thread(target=warm_up, daemon=True).start()
+
+if os.environ.get('REPORT_SCHEDULE') == '1':
+    start_report_scheduler()
+
+if os.environ.get('CATALOG_WATCHER', '1') == '1':
+    # gunicorn 下由 post_fork 在各 worker 啟動（見 gunicorn.conf.py），不在 master 輪詢
+    start_catalog_watcher()
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5566, debug=True)
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5566)), debug=True)
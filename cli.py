@@ -0,0 +1,417 @@
+"""離線批次分析：不經 Web 服務處理大量（封存）LOG，適合 cron 排程
+
+用法：
+  python cli.py 'archive/2025-09-*.log.gz' --jobs 4 --outputs json,parquet --checkpoint output/batch-2025-09
+  zcat access.log.*.gz | python cli.py - --outputs json
+
+輸入為檔案路徑或 glob（.gz 自動解壓），'-' 表示 stdin。每個檔案由一個 worker 串流解析成
+可合併的部分統計（PartialAggregate），主行程合併後輸出，記憶體用量與資料量無關。
+進度以 JSON Lines 寫到 stderr，結束時以一行 JSON 摘要寫到 stdout；有檔案失敗時結束碼為 1。
+"""
+import os
+import sys
+import glob
+import gzip
+import json
+import time
+import uuid
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+
+from log_analyzer import LogAnalyzer
+from partial_aggregates import PartialAggregate
+from log_utils import parse_epoch, write_json_atomic
+import log_store
+
+
+OUTPUTS = ('json', 'parquet', 'charts')
+STATE_FILE = 'state.json'
+
+# 每個 worker 行程各自建立一個分析器（見 _init_worker）
+_analyzer: Optional[LogAnalyzer] = None
+_options: Dict[str, Any] = {}
+
+
+def _emit(event: str, **fields):
+    """輸出一行 JSON 進度事件到 stderr"""
+    if _options.get('quiet'):
+        return
+    record = {'event': event, 'time': datetime.now(timezone.utc).isoformat(timespec='seconds')}
+    record.update(fields)
+    sys.stderr.write(json.dumps(record, ensure_ascii=False) + '\n')
+    sys.stderr.flush()
+
+
+def _init_worker(options: Dict[str, Any]):
+    global _analyzer, _options
+    _options = options
+    _analyzer = LogAnalyzer(
+        log_dir=os.getcwd(),
+        output_dir=options['output_dir'],
+        log_format=options['log_format'],
+        log_format_style=options['log_format_style'],
+        route_rules=options['route_rules'],
+        url_query_mode=options['url_query_mode'],
+    )
+
+
+def _consume(records, source: str, part_key: str) -> Dict[str, Any]:
+    """將 (記錄, epoch) 串流分批累加到部分統計，需要時同批寫出資料集"""
+    agg = PartialAggregate()
+    fmt = _options['dataset_format']
+    batch_size = _options['batch_size']
+    batch: List[Dict[str, Any]] = []
+    count = parts = dataset_files = 0
+
+    def flush():
+        nonlocal parts, dataset_files
+        agg.add_logs(batch)
+        if fmt:
+            # 固定檔名：中斷後重跑同一檔案會覆蓋而非重複寫入
+            dataset_files += len(_analyzer.export_dataset(batch, fmt, source_file=source,
+                                                          part_name=f'{part_key}-{parts}'))
+        parts += 1
+
+    for record, _ in records:
+        batch.append(record)
+        count += 1
+        if len(batch) >= batch_size:
+            flush()
+            batch = []
+    if batch:
+        flush()
+    return {'records': count, 'dataset_files': dataset_files, 'partial': agg.to_dict()}
+
+
+def _process_file(path: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    bounds = (_options['start_epoch'], _options['end_epoch'], _options['domain'])
+    # 資料集檔名只依路徑決定：先刪除此檔先前寫出的部分（檔案變動或中斷後重跑），再重新寫出
+    part_key = _part_key(path)
+    if _options['dataset_format']:
+        log_store.remove_parts(log_store.dataset_path(_options['output_dir'], _options['dataset_format']), part_key)
+    if path.endswith('.gz'):
+        with gzip.open(path, 'rb') as f:
+            result = _consume(_analyzer.iter_line_records(f, *bounds), os.path.basename(path), part_key)
+    else:
+        result = _consume(_analyzer.iter_file_records(path, *bounds), os.path.basename(path), part_key)
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def _process_lines(lines: List[bytes], key: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    bounds = (_options['start_epoch'], _options['end_epoch'], _options['domain'])
+    result = _consume(_analyzer.iter_line_records(lines, *bounds), 'stdin', key)
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+class Checkpoint:
+    """可續跑的進度目錄：state.json 記錄已完成檔案（路徑/大小/mtime），各檔部分統計另存一檔
+
+    分析條件（時間、網域、格式、路由規則內容、資料集輸出）不同時拒絕沿用，避免混入不同條件的結果；
+    檔案變動後重新處理時，舊的部分統計檔一併刪除。
+    """
+
+    def __init__(self, path: str, fingerprint: Dict[str, Any], reset: bool = False):
+        self.path = path
+        self.fingerprint = fingerprint
+        os.makedirs(os.path.join(path, 'partials'), exist_ok=True)
+        self.files: Dict[str, Dict[str, Any]] = {}
+        state = None
+        if not reset:
+            try:
+                with open(os.path.join(path, STATE_FILE), 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = None
+        if state is not None:
+            if state.get('fingerprint') != fingerprint:
+                raise ValueError(f'checkpoint {path} 的分析條件與本次不同，請加上 --reset 或改用其他目錄')
+            self.files = state.get('files', {})
+        self._save()
+
+    def _save(self):
+        write_json_atomic(os.path.join(self.path, STATE_FILE), {'fingerprint': self.fingerprint, 'files': self.files})
+
+    def _partial_path(self, key: str) -> str:
+        return os.path.join(self.path, 'partials', f'{key}.json')
+
+    def completed(self, path: str, key: str) -> Optional[Dict[str, Any]]:
+        """檔案未變動且已完成時回傳其結果（含部分統計），否則 None"""
+        entry = self.files.get(path)
+        if not entry or entry.get('key') != key:
+            return None
+        try:
+            with open(self._partial_path(key), 'r', encoding='utf-8') as f:
+                return dict(entry, partial=json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def record(self, path: str, key: str, result: Dict[str, Any]):
+        previous = self.files.get(path, {}).get('key')
+        write_json_atomic(self._partial_path(key), result['partial'])
+        if previous and previous != key:
+            # 檔案變動後舊的部分統計不會再用到
+            try:
+                os.remove(self._partial_path(previous))
+            except OSError:
+                pass
+        self.files[path] = {k: v for k, v in result.items() if k != 'partial'}
+        self.files[path]['key'] = key
+        self._save()
+
+
+def expand_inputs(patterns: List[str]) -> List[str]:
+    """展開 glob（支援 **），去除重複並保持順序；'-' 代表 stdin"""
+    paths, seen = [], set()
+    for pattern in patterns:
+        if pattern == '-':
+            matches = ['-']
+        else:
+            matches = sorted(glob.glob(pattern, recursive=True)) or ([pattern] if os.path.exists(pattern) else [])
+            matches = [os.path.abspath(m) for m in matches if os.path.isfile(m)]
+            if not matches:
+                _emit('warning', message=f'沒有符合的檔案: {pattern}')
+        for m in matches:
+            if m not in seen:
+                seen.add(m)
+                paths.append(m)
+    return paths
+
+
+def _file_key(path: str, st: os.stat_result) -> str:
+    return hashlib.sha1(f'{path}\0{st.st_size}\0{st.st_mtime_ns}'.encode('utf-8')).hexdigest()[:16]
+
+
+def _content_hash(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _part_key(path: str) -> str:
+    return hashlib.sha1(path.encode('utf-8')).hexdigest()[:16]
+
+
+def _read_chunks(stream, chunk_lines: int):
+    chunk = []
+    for line in stream:
+        chunk.append(line)
+        if len(chunk) >= chunk_lines:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def parse_outputs(value: str) -> List[str]:
+    outputs = [v.strip().lower() for v in (value or '').split(',') if v.strip()]
+    if outputs == ['none']:
+        return []
+    unknown = [v for v in outputs if v not in OUTPUTS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f'未知的輸出: {", ".join(unknown)}（可用: {", ".join(OUTPUTS)} 或 none）')
+    return outputs
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='離線批次分析LOG（進度以 JSON Lines 輸出到 stderr）')
+    parser.add_argument('inputs', nargs='*', default=['-'], help="檔案路徑或 glob（.gz 自動解壓）；'-' 為 stdin（預設）")
+    parser.add_argument('--output-dir', default=os.environ.get('OUTPUT_DIR', 'output'))
+    parser.add_argument('--outputs', type=parse_outputs, default=['json'],
+                        help='逗號分隔：json、parquet、charts，或 none（只輸出摘要）')
+    parser.add_argument('--dataset-format', default='parquet', choices=sorted(log_store.SUPPORTED_FORMATS),
+                        help='--outputs 含 parquet 時的資料集格式')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1, help='平行處理的行程數（1 為不另開行程）')
+    parser.add_argument('--checkpoint', help='續跑用的進度目錄；重跑時略過已完成且未變動的檔案（stdin 不適用）')
+    parser.add_argument('--reset', action='store_true', help='忽略既有的 checkpoint 內容重新開始')
+    parser.add_argument('--start-time', help='開始時間（ISO 8601，例如 2025-09-01T00:00:00+08:00）')
+    parser.add_argument('--end-time', help='結束時間')
+    parser.add_argument('--domain', help='只統計 URL 或 referer 含此字串的請求')
+    parser.add_argument('--interval', default='daily', choices=['hourly', 'daily', 'weekly', 'monthly'], help='圖表時間級距')
+    parser.add_argument('--top-n', type=int, default=10)
+    parser.add_argument('--log-format', default=os.environ.get('LOG_FORMAT'))
+    parser.add_argument('--log-format-style', default=os.environ.get('LOG_FORMAT_STYLE', 'nginx'), choices=['nginx', 'apache'])
+    parser.add_argument('--route-rules', default=os.environ.get('ROUTE_RULES'))
+    parser.add_argument('--url-query-mode', default=os.environ.get('URL_QUERY_MODE', 'mask'), choices=['mask', 'strip', 'keep'])
+    parser.add_argument('--batch-size', type=int, default=50000, help='每批累加/寫出的記錄數')
+    parser.add_argument('--chunk-lines', type=int, default=200000, help='stdin 每個工作單位的行數')
+    parser.add_argument('--quiet', '-q', action='store_true', help='不輸出進度事件')
+    return parser
+
+
+def run(args) -> Dict[str, Any]:
+    started = time.perf_counter()
+    os.makedirs(args.output_dir, exist_ok=True)
+    epochs = {}
+    for name, value in (('start_epoch', args.start_time), ('end_epoch', args.end_time)):
+        epochs[name] = parse_epoch(value)
+        if value and epochs[name] is None:
+            raise ValueError(f'無法解析的時間: {value}（請使用 ISO 8601）')
+    options = {
+        'output_dir': args.output_dir,
+        'start_epoch': epochs['start_epoch'],
+        'end_epoch': epochs['end_epoch'],
+        'domain': args.domain,
+        'log_format': args.log_format,
+        'log_format_style': args.log_format_style,
+        'route_rules': args.route_rules,
+        'url_query_mode': args.url_query_mode,
+        'dataset_format': args.dataset_format if 'parquet' in args.outputs else None,
+        'batch_size': max(args.batch_size, 1),
+        'quiet': args.quiet,
+    }
+    _init_worker(options)
+
+    inputs = expand_inputs(args.inputs)
+    files = [p for p in inputs if p != '-']
+    use_stdin = '-' in inputs
+    fingerprint = {k: options[k] for k in ('start_epoch', 'end_epoch', 'domain', 'log_format', 'log_format_style',
+                                           'route_rules', 'url_query_mode', 'dataset_format')}
+    # 路由規則以檔案內容判斷：同一路徑的規則被修改時也不沿用舊的部分統計
+    if args.route_rules:
+        fingerprint['route_rules_sha1'] = _content_hash(args.route_rules)
+    checkpoint = Checkpoint(args.checkpoint, fingerprint, args.reset) if args.checkpoint else None
+
+    merged = PartialAggregate()
+    summary = {'files': len(files), 'skipped': 0, 'processed': 0, 'failed': [], 'records': 0, 'dataset_files': 0}
+
+    def accept(result: Dict[str, Any]):
+        merged.merge(PartialAggregate.from_dict(result['partial']))
+        summary['records'] += result['records']
+        summary['dataset_files'] += result.get('dataset_files', 0)
+
+    pending = []
+    for path in files:
+        try:
+            key = _file_key(path, os.stat(path))
+        except OSError as e:
+            summary['failed'].append(path)
+            _emit('file_error', file=path, error=str(e))
+            continue
+        done = checkpoint.completed(path, key) if checkpoint else None
+        if done:
+            accept(done)
+            summary['skipped'] += 1
+        else:
+            pending.append((path, key))
+    _emit('start', files=len(files), pending=len(pending), skipped=summary['skipped'], stdin=use_stdin,
+          jobs=args.jobs, outputs=args.outputs)
+
+    def finished(path: str, key: str, result: Dict[str, Any]):
+        accept(result)
+        summary['processed'] += 1
+        if checkpoint:
+            checkpoint.record(path, key, result)
+        done = summary['processed'] + summary['skipped'] + len(summary['failed'])
+        _emit('file_done', file=path, records=result['records'], seconds=result['seconds'],
+              done=done, total=len(files), total_records=summary['records'])
+
+    def failed(path: str, error: Exception):
+        summary['failed'].append(path)
+        _emit('file_error', file=path, error=str(error))
+
+    executor = ProcessPoolExecutor(args.jobs, initializer=_init_worker, initargs=(options,)) if args.jobs > 1 else None
+    try:
+        if executor is None:
+            for path, key in pending:
+                try:
+                    finished(path, key, _process_file(path))
+                except Exception as e:
+                    failed(path, e)
+        else:
+            futures = {executor.submit(_process_file, path): (path, key) for path, key in pending}
+            for future in as_completed(futures):
+                path, key = futures[future]
+                try:
+                    finished(path, key, future.result())
+                except Exception as e:
+                    failed(path, e)
+
+        if use_stdin:
+            # stdin 無法續跑：分段送給 worker，同時在途的段數有上限以限制記憶體
+            run_id = uuid.uuid4().hex[:12]
+            in_flight = []
+            chunks = 0
+
+            def collect(result):
+                accept(result)
+                _emit('chunk_done', source='stdin', records=result['records'], seconds=result['seconds'],
+                      total_records=summary['records'])
+
+            for i, chunk in enumerate(_read_chunks(sys.stdin.buffer, max(args.chunk_lines, 1))):
+                chunks += 1
+                if executor is None:
+                    collect(_process_lines(chunk, f'stdin-{run_id}-{i}'))
+                    continue
+                in_flight.append(executor.submit(_process_lines, chunk, f'stdin-{run_id}-{i}'))
+                if len(in_flight) >= args.jobs * 2:
+                    collect(in_flight.pop(0).result())
+            for future in in_flight:
+                collect(future.result())
+            summary['stdin_chunks'] = chunks
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    # 沒有任何記錄時 finalize 回傳 {}，仍照常輸出空結果
+    stats = merged.finalize(args.top_n)
+    outputs: Dict[str, Any] = {}
+    errors: Dict[str, str] = {}
+    if 'json' in args.outputs:
+        path = os.path.join(args.output_dir, 'analysis_results.json')
+        write_json_atomic(path, {
+            'basic_stats': stats,
+            'generated_at': datetime.now().isoformat(),
+            'start_time': args.start_time,
+            'end_time': args.end_time,
+            'domain': args.domain,
+            'inputs': inputs,
+            'failed': summary['failed'],
+        })
+        outputs['json'] = path
+        _emit('output', kind='json', path=path)
+    if options['dataset_format']:
+        outputs['parquet'] = log_store.dataset_path(args.output_dir, options['dataset_format'])
+    if 'charts' in args.outputs:
+        try:
+            # 熱門 URL 圖表取前 12 名
+            chart_stats = stats if args.top_n >= 12 else merged.finalize(12)
+            outputs['charts'] = _analyzer.charts_from_aggregate(chart_stats, args.interval, args.output_dir)
+            _emit('output', kind='charts', paths=outputs['charts'])
+        except Exception as e:
+            errors['charts'] = str(e)
+            _emit('output_error', kind='charts', error=str(e))
+
+    summary.update(
+        status='ok' if not summary['failed'] and not errors else 'partial',
+        outputs=outputs,
+        output_errors=errors,
+        total_requests=stats.get('total_requests', 0),
+        seconds=round(time.perf_counter() - started, 3),
+    )
+    _emit('done', status=summary['status'], records=summary['records'], seconds=summary['seconds'])
+    return summary
+
+
+def main(argv: List[str] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        summary = run(args)
+    except ValueError as e:
+        print(json.dumps({'status': 'error', 'error': str(e)}, ensure_ascii=False))
+        return 2
+    except Exception as e:
+        # 輸出目錄無法寫入、checkpoint 損壞等：同樣以 JSON 回報，結束碼為 1
+        print(json.dumps({'status': 'error', 'error': f'{type(e).__name__}: {e}'}, ensure_ascii=False))
+        return 1
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0 if summary['status'] == 'ok' else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,250 @@
+import os
+import re
+import json
+import threading
+import zlib
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Callable
+
+from log_utils import record_epoch, iso_utc, tail_settled, write_json_atomic
+
+
+# 各常見格式的時間欄位：access [24/Sep/2025:09:35:41 +0800]、nginx error 行首、apache error [Wed Sep 24 ...]、ISO 8601
+_TS = re.compile(
+    rb'(\d{2}/[A-Za-z]{3}/\d{4}:\d{2}:\d{2}:\d{2} [+-]\d{4})'
+    rb'|^(\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2})'
+    rb'|^\[([A-Za-z]{3} [A-Za-z]{3} \d{2} \d{2}:\d{2}:\d{2}\.\d+ \d{4})\]'
+    rb'|(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?)'
+)
+_CHUNK = 4 * 1024 * 1024
+_PROBE_BYTES = 64 * 1024
+_PROBE_LINES = 200
+# 檔頭 CRC 的長度：判斷檔案是否仍是同一份內容（截斷後原地重寫時會不同）
+_HEAD_BYTES = 256
+LOG_TYPES = {'combined': 'access', 'custom': 'access', 'nginx_error': 'error', 'apache_error': 'error'}
+
+
+def _line_epoch(m) -> Optional[int]:
+    return record_epoch(m.group(m.lastindex).decode('ascii', errors='replace'))
+
+
+def _head_crc(path: str, length: int) -> int:
+    with open(path, 'rb') as f:
+        return zlib.crc32(f.read(length))
+
+
+def _detect_encoding(sample: bytes) -> str:
+    # 與解析時的解碼順序一致
+    for enc in ('utf-8', 'cp950', 'big5'):
+        try:
+            sample.decode(enc)
+            return enc
+        except UnicodeDecodeError:
+            continue
+    return 'latin-1'
+
+
+class FileCatalog:
+    """LOG 目錄的持久化檔案目錄：大小、mtime、inode、格式、編碼、首末時間與行數
+
+    refresh() 只對有變動的檔案掃描：同一 inode 且變大時只讀新增部分，輪替/截斷時重新掃描。
+    結果以 JSON 原子寫入 output_dir，重啟後沿用；start() 啟動輪詢執行緒定期更新。
+    """
+
+    def __init__(self, log_dir: str, catalog_path: str, extensions, detect: Callable[[str], Optional[str]],
+                 on_change: Callable[[List[str]], None] = None):
+        self.log_dir = log_dir
+        self.catalog_path = catalog_path
+        self.extensions = tuple(extensions)
+        self.detect = detect
+        # 有檔案新增或變動時以檔名清單呼叫（例如增量匯入時序資料）
+        self.on_change = on_change
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._refreshed = False
+        self.interval = None
+        try:
+            with open(catalog_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get('files', {})
+        except (OSError, ValueError):
+            self.entries = {}
+
+    # ---- 掃描 ----
+
+    def _probe(self, path: str) -> Dict[str, Any]:
+        """讀取檔頭判斷編碼與格式（多數行符合的格式；兩種類型都有時為 mixed）"""
+        with open(path, 'rb') as f:
+            head = f.read(_PROBE_BYTES)
+        cut = head.rfind(b'\n')
+        if cut > 0:
+            head = head[:cut]
+        encoding = _detect_encoding(head)
+        counts: Dict[str, int] = {}
+        for line in head.decode(encoding, errors='replace').splitlines()[:_PROBE_LINES]:
+            fmt = self.detect(line) if line.strip() else None
+            if fmt:
+                counts[fmt] = counts.get(fmt, 0) + 1
+        if not counts:
+            return {'encoding': encoding, 'format': 'unknown', 'type': 'unknown'}
+        fmt = max(counts, key=counts.get)
+        types = {LOG_TYPES.get(k, 'unknown') for k in counts}
+        return {'encoding': encoding, 'format': fmt, 'type': types.pop() if len(types) == 1 else 'mixed'}
+
+    @staticmethod
+    def _scan(path: str, offset: int, size: int, tail: bool = False):
+        """從 offset 掃描到 size 前最後一個完整行（tail 為真時含未以換行結束的最後一行），
+        回傳 (新位移, 行數, 最早 epoch, 最晚 epoch)"""
+        lines = 0
+        first = last = None
+        search = _TS.search
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            pending = b''
+            remaining = size - offset
+            while True:
+                chunk = f.read(min(_CHUNK, remaining)) if remaining > 0 else b''
+                remaining -= len(chunk)
+                if not chunk:
+                    if not (tail and pending):
+                        break
+                    # 檔尾已穩定：把最後一行當作完整行計入
+                    data, pending = pending + b'\n', b''
+                else:
+                    data = pending + chunk
+                cut = data.rfind(b'\n')
+                if cut == -1:
+                    pending = data
+                    continue
+                pending = data[cut + 1:]
+                body = data[:cut]
+                lines += body.count(b'\n') + 1
+                offset += cut + 1
+                for line in body.split(b'\n'):
+                    m = search(line)
+                    if not m:
+                        continue
+                    ep = _line_epoch(m)
+                    if ep is None:
+                        continue
+                    if first is None or ep < first:
+                        first = ep
+                    if last is None or ep > last:
+                        last = ep
+        return min(offset, size), lines, first, last
+
+    def _update(self, name: str, st: os.stat_result) -> Dict[str, Any]:
+        path = os.path.join(self.log_dir, name)
+        entry = self.entries.get(name)
+        appended = (entry and entry['inode'] == st.st_ino and st.st_size >= entry.get('scanned_offset', 0)
+                    and entry.get('head_len') is not None and _head_crc(path, entry['head_len']) == entry.get('head'))
+        if appended:
+            if entry['size'] == st.st_size and entry['mtime'] == st.st_mtime and entry['scanned_offset'] >= st.st_size:
+                return entry
+            entry = dict(entry)
+            settled = tail_settled(st, entry['size'], entry['mtime'])
+        else:
+            entry = dict(self._probe(path), line_count=0, scanned_offset=0, first_epoch=None, last_epoch=None)
+            settled = tail_settled(st)
+        offset, lines, first, last = self._scan(path, entry['scanned_offset'], st.st_size, settled)
+        if first is not None and (entry['first_epoch'] is None or first < entry['first_epoch']):
+            entry['first_epoch'] = first
+        if last is not None and (entry['last_epoch'] is None or last > entry['last_epoch']):
+            entry['last_epoch'] = last
+        head_len = min(offset, _HEAD_BYTES)
+        entry.update(
+            filename=name,
+            size=st.st_size,
+            mtime=st.st_mtime,
+            inode=st.st_ino,
+            head=_head_crc(path, head_len),
+            head_len=head_len,
+            line_count=entry['line_count'] + lines,
+            scanned_offset=offset,
+            first_ts=iso_utc(entry['first_epoch']),
+            last_ts=iso_utc(entry['last_epoch']),
+            scanned_at=datetime.now(timezone.utc).isoformat(),
+        )
+        if entry['format'] == 'unknown' and entry['line_count']:
+            # 新檔建立時可能還是空的：有內容後重新判斷格式
+            entry.update(self._probe(path))
+        return entry
+
+    def refresh(self) -> Dict[str, Dict[str, Any]]:
+        """依 stat 結果更新目錄（只掃描變動的檔案），有變動時寫回 JSON"""
+        with self._lock:
+            if not os.path.isdir(self.log_dir):
+                names = []
+            else:
+                names = [f for f in os.listdir(self.log_dir) if f.endswith(self.extensions)]
+            entries = {}
+            for name in names:
+                try:
+                    st = os.stat(os.path.join(self.log_dir, name))
+                    entries[name] = self._update(name, st)
+                except OSError:
+                    continue
+            changed = [name for name, entry in entries.items() if self.entries.get(name) != entry]
+            removed = entries.keys() != self.entries.keys()
+            self.entries = entries
+            self._refreshed = True
+            if changed or removed:
+                try:
+                    write_json_atomic(self.catalog_path, {'log_dir': self.log_dir, 'files': entries})
+                except OSError:
+                    pass
+        if changed and self.on_change is not None:
+            try:
+                self.on_change(changed)
+            except Exception as e:
+                print(f"檔案變動處理失敗: {e}")
+        return entries
+
+    # ---- 查詢 ----
+
+    @property
+    def watching(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def files(self, start_epoch: int = None, end_epoch: int = None, refresh: bool = None) -> List[Dict[str, Any]]:
+        """列出檔案；指定時間範圍時略過首末時間完全不重疊的檔案（無時間資訊的檔案一律保留）
+
+        refresh 預設為「輪詢執行緒未運作、或尚未完成第一次掃描時先增量更新一次」，否則直接使用快取。
+        """
+        if refresh is None:
+            refresh = not (self.watching and self._refreshed)
+        entries = self.refresh() if refresh else self.entries
+        result = []
+        for entry in entries.values():
+            first, last = entry.get('first_epoch'), entry.get('last_epoch')
+            if entry.get('scanned_offset', 0) < entry.get('size', 0):
+                # 檔尾仍有未掃描的內容，最晚時間未知
+                last = None
+            if start_epoch is not None and last is not None and last < start_epoch:
+                continue
+            if end_epoch is not None and first is not None and first > end_epoch:
+                continue
+            result.append(entry)
+        return result
+
+    # ---- 輪詢執行緒 ----
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"檔案目錄更新失敗: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self, interval: float = 10.0):
+        self.interval = interval
+        if not self.watching:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='file-catalog', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,32 @@
+import json
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+
+def parse_peers(value: Optional[str]) -> List[str]:
+    """解析 PEER_NODES（逗號分隔的節點 base URL，例如 http://web1:5000,http://web2:5000）"""
+    return [p.strip().rstrip('/') for p in (value or '').split(',') if p.strip()]
+
+
+def _fetch(peer: str, path: str, params: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    query = urllib.parse.urlencode({k: v for k, v in params.items() if v})
+    url = f'{peer}{path}' + (f'?{query}' if query else '')
+    with urllib.request.urlopen(url, timeout=timeout) as resp:
+        return json.loads(resp.read().decode('utf-8'))
+
+
+def fan_out(peers: List[str], path: str, params: Dict[str, Any], timeout: float = 30.0) -> List[Dict[str, Any]]:
+    """平行向各節點查詢，回傳每個節點的結果或錯誤（不因單一節點失敗而中斷）"""
+    if not peers:
+        return []
+
+    def call(peer):
+        try:
+            return {'node': peer, 'ok': True, 'data': _fetch(peer, path, params, timeout)}
+        except Exception as e:
+            return {'node': peer, 'ok': False, 'error': str(e)}
+
+    with ThreadPoolExecutor(max_workers=min(len(peers), 16)) as pool:
+        return list(pool.map(call, peers))
@@ -0,0 +1,35 @@
+import os
+import threading
+
+# gunicorn 設定：docker 映像預設以 `gunicorn -c gunicorn.conf.py app:app` 啟動
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_WORKERS', '2'))
+
+# 在 master 先載入 app 並預熱 pandas/plotly，之後 fork 出的 worker 直接共用已載入的模組
+preload_app = os.environ.get('PRELOAD_APP', '1') == '1'
+
+# 報表排程改在 worker 內啟動（見 post_fork），避免 master 預載 app 時就啟動背景執行緒；
+# 多個 worker 以檔案鎖協調，同一時間只有一個在產生報表
+report_schedule = os.environ.pop('REPORT_SCHEDULE', '0') == '1'
+
+# 檔案目錄輪詢同樣只在 worker 內啟動：master 若在 fork 時持有目錄的鎖，worker 複製到的鎖會永遠鎖住
+os.environ['CATALOG_WATCHER'] = '0'
+
+
+def when_ready(server):
+    """master 就緒、fork worker 之前：預載分析與繪圖模組（不啟動 kaleido）"""
+    if preload_app:
+        from app import warm_up
+        warm_up(charts=False)
+
+
+def post_fork(server, worker):
+    """每個 worker fork 後：於背景啟動 kaleido，避免第一張圖表冷啟動，也不延遲 /health"""
+    if os.environ.get('WARM_UP_CHARTS', '1') == '1':
+        from app import warm_up
+        threading.Thread(target=warm_up, kwargs={'charts': True}, daemon=True).start()
+    if report_schedule:
+        from app import start_report_scheduler
+        start_report_scheduler()
+    from app import start_catalog_watcher
+    start_catalog_watcher()
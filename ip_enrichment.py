@@ -0,0 +1,204 @@
+import csv
+import bisect
+import ipaddress
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Iterable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# CSV 欄位別名（相容 GeoLite2 CSV 與 ip2asn 等常見格式）
+_NETWORK_KEYS = ('network', 'cidr', 'prefix')
+_START_KEYS = ('start', 'range_start', 'start_ip', 'ip_from')
+_END_KEYS = ('end', 'range_end', 'end_ip', 'ip_to')
+_COUNTRY_KEYS = ('country', 'country_code', 'country_iso_code', 'iso_code')
+_ASN_KEYS = ('asn', 'as_number', 'autonomous_system_number')
+_ORG_KEYS = ('as_org', 'as_name', 'as_description', 'organization', 'autonomous_system_organization')
+
+
+def _first(row: Dict[str, str], keys) -> Optional[str]:
+    for key in keys:
+        value = row.get(key)
+        if value not in (None, '', '-'):
+            return value.strip()
+    return None
+
+
+def _asn(value: Optional[str]) -> Optional[int]:
+    if not value:
+        return None
+    value = value.upper()
+    if value.startswith('AS'):
+        value = value[2:]
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def _to_int(ip: str) -> Optional[tuple]:
+    """IP 字串 -> (版本, 整數)；無效值回傳 None"""
+    try:
+        addr = ipaddress.ip_address(ip.strip())
+    except (ValueError, AttributeError):
+        return None
+    return addr.version, int(addr)
+
+
+class IpRangeTable:
+    """排序後的 IP 區間表（IPv4/IPv6 分開），以二分搜尋查詢所屬區間
+
+    區間不可重疊（GeoLite2 / ip2asn CSV 皆符合）；重疊時以起點較大者（較晚開始的區間）為準。
+    """
+
+    def __init__(self):
+        self._starts = {4: [], 6: []}
+        self._ends = {4: [], 6: []}
+        self._values = {4: [], 6: []}
+
+    @classmethod
+    def from_csv(cls, path: str) -> 'IpRangeTable':
+        """讀取 CSV：network（CIDR）或 start/end 欄位，加上 country/asn/as_org 等屬性欄位"""
+        rows = []
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.DictReader(f)
+            reader.fieldnames = [h.strip().lower() for h in (reader.fieldnames or [])]
+            for row in reader:
+                network = _first(row, _NETWORK_KEYS)
+                if network:
+                    try:
+                        net = ipaddress.ip_network(network, strict=False)
+                    except ValueError:
+                        continue
+                    version, start, end = net.version, int(net.network_address), int(net.broadcast_address)
+                else:
+                    s = _to_int(_first(row, _START_KEYS) or '')
+                    e = _to_int(_first(row, _END_KEYS) or '')
+                    if not s or not e or s[0] != e[0]:
+                        continue
+                    version, start, end = s[0], s[1], e[1]
+                info = {
+                    'country': _first(row, _COUNTRY_KEYS),
+                    'asn': _asn(_first(row, _ASN_KEYS)),
+                    'as_org': _first(row, _ORG_KEYS),
+                }
+                rows.append((version, start, end, info))
+        table = cls()
+        for version, start, end, info in sorted(rows, key=lambda r: (r[0], r[1])):
+            table._starts[version].append(start)
+            table._ends[version].append(end)
+            table._values[version].append(info)
+        return table
+
+    def lookup(self, ip: str) -> Optional[Dict[str, Any]]:
+        parsed = _to_int(ip)
+        if parsed is None:
+            return None
+        version, value = parsed
+        i = bisect.bisect_right(self._starts[version], value) - 1
+        if i >= 0 and value <= self._ends[version][i]:
+            return self._values[version][i]
+        return None
+
+    def __len__(self) -> int:
+        return len(self._starts[4]) + len(self._starts[6])
+
+
+class MaxMindTable:
+    """MaxMind .mmdb（GeoLite2-Country/City/ASN）；需安裝選用套件 maxminddb"""
+
+    def __init__(self, path: str):
+        try:
+            import maxminddb
+        except ImportError as e:
+            raise RuntimeError('讀取 .mmdb 需要安裝 maxminddb（pip install maxminddb）') from e
+        self._reader = maxminddb.open_database(path)
+
+    def lookup(self, ip: str) -> Optional[Dict[str, Any]]:
+        try:
+            data = self._reader.get(ip.strip())
+        except (ValueError, AttributeError):
+            return None
+        if not data:
+            return None
+        country = (data.get('country') or data.get('registered_country') or {}).get('iso_code')
+        return {
+            'country': country,
+            'asn': data.get('autonomous_system_number'),
+            'as_org': data.get('autonomous_system_organization'),
+        }
+
+
+def cidr_block(ip: str, v4_prefix: int = 24, v6_prefix: int = 48) -> Optional[str]:
+    """IP 所屬網段（預設 IPv4 /24、IPv6 /48）"""
+    try:
+        addr = ipaddress.ip_address(ip.strip())
+    except (ValueError, AttributeError):
+        return None
+    prefix = v4_prefix if addr.version == 4 else v6_prefix
+    return str(ipaddress.ip_network(f'{addr}/{prefix}', strict=False))
+
+
+class IpEnricher:
+    """離線 IP 資訊查詢（國家 / ASN / 網段），前置 LRU 快取
+
+    database 為 .mmdb（MaxMind 格式）或 CSV 區間檔；未提供時只計算網段。
+    逐欄處理時只查詢相異 IP，再對應回整欄，成本與相異 IP 數成正比而非行數。
+    """
+
+    EMPTY = {'country': None, 'asn': None, 'as_org': None}
+
+    def __init__(self, database: Optional[str] = None, cache_size: int = 65536,
+                 v4_prefix: int = 24, v6_prefix: int = 48):
+        self.database = database
+        self.table = None
+        if database:
+            self.table = MaxMindTable(database) if database.endswith('.mmdb') else IpRangeTable.from_csv(database)
+        self.v4_prefix = v4_prefix
+        self.v6_prefix = v6_prefix
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def _lookup(self, ip: Optional[str]) -> Dict[str, Any]:
+        if not ip:
+            return dict(self.EMPTY, cidr=None)
+        info = (self.table.lookup(ip) if self.table is not None else None) or self.EMPTY
+        return dict(info, cidr=cidr_block(ip, self.v4_prefix, self.v6_prefix))
+
+    def annotate(self, items: Iterable[Dict[str, Any]], key: str = 'ip') -> List[Dict[str, Any]]:
+        """在含 ip 欄位的清單（例如 top_ips）各項加上 country/asn/as_org/cidr"""
+        return [dict(item, **self.lookup(str(item.get(key)))) for item in items]
+
+    def enrich_frame(self, df: 'pd.DataFrame', column: str = 'ip') -> 'pd.DataFrame':
+        """對 DataFrame 的 IP 欄位加上 country/asn/as_org/cidr 欄（只查詢相異值）"""
+        import pandas as pd
+        codes, uniques = pd.factorize(df[column])
+        infos = [self.lookup(str(ip)) for ip in uniques]
+        for field in ('country', 'asn', 'as_org', 'cidr'):
+            values = pd.Series([info[field] for info in infos] + [None], dtype=object)
+            # 缺值代碼 -1 對應到最後一個 None
+            df[field] = pd.Categorical(values.take(codes).to_numpy())
+        return df
+
+    def aggregate(self, df: 'pd.DataFrame', top_n: int = 20) -> Dict[str, Any]:
+        """依國家 / ASN / 網段彙總請求數與相異 IP 數"""
+        df = self.enrich_frame(df)
+
+        def group(keys: List[str]):
+            grouped = df.groupby(keys, observed=True, dropna=False).agg(
+                count=('ip', 'size'), unique_ips=('ip', 'nunique'))
+            grouped = grouped.sort_values('count', ascending=False).head(top_n).reset_index()
+            records = grouped.astype(object).where(grouped.notna(), None).to_dict('records')
+            for r in records:
+                r['count'] = int(r['count'])
+                r['unique_ips'] = int(r['unique_ips'])
+                if r.get('asn') is not None:
+                    r['asn'] = int(r['asn'])
+            return records
+
+        return {
+            'total_requests': int(len(df)),
+            'database': self.database,
+            'by_country': group(['country']),
+            'by_asn': group(['asn', 'as_org']),
+            'by_cidr': group(['cidr']),
+        }
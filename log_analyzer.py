@@ -1,22 +1,56 @@
 import re
 import os
+import mmap
+import threading
+import time
+from array import array
 from datetime import datetime, timedelta
 from collections import Counter, defaultdict
-from typing import List, Dict, Any
-import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
+from typing import List, Dict, Any, TYPE_CHECKING
 import json
+import log_store
+from partial_aggregates import PartialAggregate
+from symbol_table import SymbolTable
+from log_utils import parse_epoch, decode_bytes, iso_utc, write_json_atomic
+from log_format import compile_format
+from partial_aggregates import LatencyAggregate
+from url_normalizer import UrlNormalizer, load_route_rules
+from template_miner import TemplateStats
+from sampling import SampledStats, plan_blocks, block_position, DEFAULT_RATES, DEFAULT_BLOCK_SIZE, MIN_STOP_BLOCKS
+from ip_enrichment import IpEnricher
+from file_catalog import FileCatalog
+from timeseries_store import TimeSeriesStore, parse_retention, series_from_records
+
+# pandas / plotly 於第一次使用時才載入（見各方法內 import），縮短 worker 啟動時間
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 class LogAnalyzer:
     """Apache/Nginx LOG分析器"""
     
-    def __init__(self, log_dir: str = "/app/logs", output_dir: str = "/app/output"):
+    LOG_EXTENSIONS = ('.log', '.error.log', '.err', '.error')
+    # 高重複的字串欄位：解析時經符號表共用字串物件
+    SYMBOL_FIELDS = ('ip', 'method', 'url', 'route', 'protocol', 'referer', 'user_agent', 'level', 'host')
+    # 統計時會分組/計數的欄位：轉為 category，value_counts/nunique 改以整數代碼運算
+    CATEGORY_FIELDS = ('ip', 'method', 'url', 'route')
+
+    def __init__(self, log_dir: str = "/app/logs", output_dir: str = "/app/output", query_backend: str = None,
+                 log_format: str = None, log_format_style: str = 'nginx', route_rules: str = None,
+                 url_query_mode: str = 'mask', ip_database: str = None, timeseries: bool = False,
+                 timeseries_retention: str = None):
         self.log_dir = log_dir
         self.output_dir = output_dir
         self.log_pattern = r'(\S+) - - \[([^\]]+)\] "(\S+) ([^"]+) (\S+)" (\d+) (\d+) "([^"]*)" "([^"]*)"'
+        # 同一格式的 bytes 版本，直接在 mmap 緩衝區上比對
+        self._log_pattern_bytes = re.compile(self.log_pattern.encode('ascii'))
+        # 自訂 access 格式（nginx log_format / Apache LogFormat），優先於內建 combined 格式
+        self.access_format = compile_format(log_format, log_format_style) if log_format else None
+        # URL -> 路由樣板（去除/遮蔽查詢參數、數字/UUID/雜湊片段、自訂規則），依原始 URL 快取
+        self.url_normalizer = UrlNormalizer(url_query_mode, load_route_rules(route_rules) if route_rules else None)
+        self._route = self.url_normalizer.normalize
+        # 選用的離線 IP 資料庫（.mmdb 或 CSV 區間檔），為熱門/高頻 IP 加上國家與 ASN
+        self.ip_enricher = IpEnricher(ip_database) if ip_database else None
         # Nginx 與 Apache error log（寬鬆匹配）
         self.error_pattern_nginx = (
             r'(?P<time>\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}) \[(?P<level>\w+)\] [^:]*: ?(?P<message>.*?)(?:, client: (?P<client>[^,]+))?(?:, server: (?P<server>[^,]+))?(?:, request: "(?P<request>[^\"]*)")?(?:, upstream: "(?P<upstream>[^\"]*)")?(?:, host: "(?P<host>[^\"]*)")?'
@@ -27,6 +61,28 @@ class LogAnalyzer:
         
         # 確保輸出目錄存在
         os.makedirs(output_dir, exist_ok=True)
+
+        # 每個檔案一個有界符號表（見 load_logs）
+        self._symbols = SymbolTable()
+        # 選用的多層級流量時序（1s/1m/1h/1d），檔案變動時增量匯入，趨勢圖改讀預先彙總的資料點
+        self.timeseries = None
+        if timeseries:
+            self.timeseries = TimeSeriesStore(os.path.join(output_dir, 'timeseries.sqlite3'), self._scan_range,
+                                              parse_retention(timeseries_retention))
+        # 持久化檔案目錄（大小/inode/格式/編碼/首末時間/行數），依時間範圍略過不重疊的檔案
+        self.catalog = FileCatalog(log_dir, os.path.join(output_dir, 'file_catalog.json'),
+                                   self.LOG_EXTENSIONS, self.detect_line_format,
+                                   on_change=self._on_files_changed if self.timeseries is not None else None)
+        # 檔案行位移索引快取：path -> (size, mtime, {'access': array, 'error': array})
+        self._offset_index = {}
+
+        # 選用的嵌入式查詢後端（目前支援 'sqlite'），啟用後統計改以 SQL 查詢執行
+        self.backend = None
+        if query_backend:
+            if query_backend != 'sqlite':
+                raise ValueError(f'不支援的查詢後端: {query_backend}')
+            from query_backend import SQLiteBackend
+            self.backend = SQLiteBackend(os.path.join(output_dir, 'logs.sqlite3'), self.parse_log_line)
         
     def _read_lines(self, file_path: str):
         """以多種編碼容錯讀檔，逐行回傳字串。"""
@@ -52,24 +108,192 @@ class LogAnalyzer:
         except Exception:
             return
 
+    def _list_log_files(self, start_epoch: int = None, end_epoch: int = None) -> List[str]:
+        """列出 log_dir 中的LOG檔名（同時包含 access 與常見 error 副檔名）
+
+        指定時間範圍時依檔案目錄的首末時間略過不重疊的檔案；此時一律先增量更新目錄，避免用到過期的時間範圍。
+        依檔名排序，使同次數項目的「首次出現」順序固定（SQLite 後端以相同規則排序）。
+        """
+        time_filter = start_epoch is not None or end_epoch is not None
+        entries = self.catalog.files(start_epoch, end_epoch, refresh=True if time_filter else None)
+        return sorted(e['filename'] for e in entries)
+
+    def detect_line_format(self, line: str):
+        """判斷單行格式：custom / combined / nginx_error / apache_error，無法辨識時回傳 None"""
+        text = line.strip()
+        if self.access_format is not None and self.access_format.regex.match(text):
+            return 'custom'
+        if re.match(self.log_pattern, text):
+            return 'combined'
+        if re.match(self.error_pattern_nginx, text):
+            return 'nginx_error'
+        if re.match(self.error_pattern_apache, text):
+            return 'apache_error'
+        return None
+
+    def _sync_backend(self, filename: str = None):
+        """查詢前將新增的LOG行增量匯入查詢後端"""
+        files = [os.path.basename(filename)] if filename else self._list_log_files()
+        paths = [os.path.join(self.log_dir, f) for f in files]
+        self.backend.ingest([p for p in paths if os.path.isfile(p)])
+
+    def _on_files_changed(self, names: List[str]):
+        self.timeseries.ingest([os.path.join(self.log_dir, n) for n in names])
+
+    def _sync_timeseries(self):
+        """查詢前將新增的LOG行增量匯入時序（未變動的檔案只做 stat 比對）"""
+        self.timeseries.ingest([os.path.join(self.log_dir, f) for f in self._list_log_files()])
+
+    def _to_epoch(self, value):
+        ts = self._to_naive_utc(value)
+        return int(ts.timestamp()) if ts is not None else None
+
+    def _record_from_match(self, m) -> Dict[str, Any]:
+        """由 bytes 正則的比對結果建立 access 記錄，只解碼擷取到的欄位"""
+        decode = decode_bytes
+        intern = self._symbols.intern
+        url = intern(decode(m.group(4)))
+        return {
+            'log_type': 'access',
+            'ip': intern(decode(m.group(1))),
+            'timestamp': decode(m.group(2)),
+            'method': intern(decode(m.group(3))),
+            'url': url,
+            'route': self._route(url),
+            'protocol': intern(decode(m.group(5))),
+            'status_code': int(m.group(6)),
+            'response_size': int(m.group(7)),
+            'referer': intern(decode(m.group(8))),
+            'user_agent': intern(decode(m.group(9)))
+        }
+
+    def _match_access(self, buf, pos: int, end: int):
+        """以 bytes 正則比對 access 行（先自訂格式，再內建格式），回傳 (match, 是否自訂格式)"""
+        if self.access_format is not None:
+            m = self.access_format.regex_bytes.match(buf, pos, end)
+            if m:
+                return m, True
+        return self._log_pattern_bytes.match(buf, pos, end), False
+
+    def _access_record(self, m, custom: bool) -> Dict[str, Any]:
+        if not custom:
+            return self._record_from_match(m)
+        return self._intern_record(self.access_format.record_from_bytes_match(m, decode_bytes))
+
+    def _intern_record(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        intern = self._symbols.intern
+        for key in self.SYMBOL_FIELDS:
+            value = record.get(key)
+            if value is not None:
+                record[key] = intern(value)
+        record['route'] = self._route(record.get('url'))
+        return record
+
+    def _scan_file(self, file_path: str, start_epoch: int = None, end_epoch: int = None):
+        """以 mmap 掃描檔案，逐筆 yield (行起始位移, 記錄)
+
+        access 行直接以 bytes 正則比對映射緩衝區，時間範圍外的行在解碼前即略過；
+        其他格式（error log）才解碼整行交給 parse_log_line。無法 mmap 時退回 _read_lines。
+        """
+        try:
+            f = open(file_path, 'rb')
+        except OSError:
+            return
+        with f:
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # 空檔或無法映射（例如特殊檔案）：退回逐行讀取，不提供位移
+                for line in self._read_lines(file_path):
+                    parsed = self.parse_log_line(line)
+                    if parsed:
+                        yield None, parsed
+                return
+            with buf:
+                yield from self._scan_range(buf, 0, len(buf), start_epoch, end_epoch)
+
+    def _scan_range(self, buf, pos: int, stop: int, start_epoch: int = None, end_epoch: int = None):
+        """掃描緩衝區中起始位移落在 [pos, stop) 的各行（最後一行可超出 stop），逐筆 yield (位移, 記錄)"""
+        size = len(buf)
+        stop = min(stop, size)
+        match = self._match_access
+        find = buf.find
+        check_time = start_epoch is not None or end_epoch is not None
+        has_custom_ts = self.access_format is not None and 'timestamp' in self.access_format.field_names
+        while pos < stop:
+            nl = find(b'\n', pos)
+            end = size if nl == -1 else nl
+            m, custom = match(buf, pos, end)
+            if m:
+                if check_time and (has_custom_ts or not custom):
+                    raw_ts = m.group('timestamp') if custom else m.group(2)
+                    ep = parse_epoch(raw_ts.decode('ascii', errors='replace'))
+                    if ep is not None and ((start_epoch is not None and ep < start_epoch) or
+                                           (end_epoch is not None and ep > end_epoch)):
+                        pos = end + 1
+                        continue
+                yield pos, self._access_record(m, custom)
+            elif end > pos:
+                parsed = self.parse_log_line(decode_bytes(buf[pos:end]))
+                if parsed:
+                    yield pos, parsed
+            pos = end + 1
+
+    def _get_offset_index(self, file_path: str) -> Dict[str, array]:
+        """取得檔案中各類型記錄的行起始位移（依檔案大小/mtime 快取），供分頁隨機存取"""
+        st = os.stat(file_path)
+        cached = self._offset_index.get(file_path)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime:
+            return cached[2]
+        index = {'access': array('q'), 'error': array('q')}
+        self._symbols = SymbolTable()
+        for offset, rec in self._scan_file(file_path):
+            if offset is None:
+                # 無法 mmap 的檔案不建立索引
+                return None
+            index[rec['log_type']].append(offset)
+        self._offset_index[file_path] = (st.st_size, st.st_mtime, index)
+        return index
+
+    def read_records_at(self, filename: str, offsets: List[int]) -> List[Dict[str, Any]]:
+        """依行起始位移直接讀取並解析指定記錄"""
+        file_path = os.path.join(self.log_dir, os.path.basename(filename))
+        records = []
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            for offset in offsets:
+                nl = buf.find(b'\n', offset)
+                end = len(buf) if nl == -1 else nl
+                m, custom = self._match_access(buf, offset, end)
+                parsed = self._access_record(m, custom) if m else self.parse_log_line(decode_bytes(buf[offset:end]))
+                if parsed:
+                    records.append(parsed)
+        return records
+
     def parse_log_line(self, line: str) -> Dict[str, Any]:
         """解析單行log：先嘗試 access，再嘗試 error（nginx/apache）"""
         text = line.strip()
+        intern = self._symbols.intern
+        # 0) 自訂 access 格式
+        if self.access_format is not None:
+            record = self.access_format.parse(text)
+            if record:
+                return self._intern_record(record)
         # 1) Access log
         match = re.match(self.log_pattern, text)
         if match:
             groups = match.groups()
             return {
                 'log_type': 'access',
-                'ip': groups[0],
+                'ip': intern(groups[0]),
                 'timestamp': groups[1],
-                'method': groups[2],
-                'url': groups[3],
-                'protocol': groups[4],
+                'method': intern(groups[2]),
+                'url': intern(groups[3]),
+                'route': self._route(groups[3]),
+                'protocol': intern(groups[4]),
                 'status_code': int(groups[5]),
                 'response_size': int(groups[6]),
-                'referer': groups[7],
-                'user_agent': groups[8]
+                'referer': intern(groups[7]),
+                'user_agent': intern(groups[8])
             }
 
         # 2) Nginx error log
@@ -103,18 +327,20 @@ class LogAnalyzer:
                 if m_client:
                     client_ip_raw = m_client.group(1)
 
+            url = intern(url or gd.get('upstream') or gd.get('host') or gd.get('server'))
             return {
                 'log_type': 'error',
                 'timestamp': gd.get('time'),
-                'ip': (client_ip_raw or '').split(':')[0],
-                'method': method,
-                'url': url or gd.get('upstream') or gd.get('host') or gd.get('server'),
+                'ip': intern((client_ip_raw or '').split(':')[0]),
+                'method': intern(method),
+                'url': url,
+                'route': self._route(url),
                 'protocol': None,
                 'status_code': None,
                 'response_size': None,
                 'referer': None,
                 'user_agent': None,
-                'level': gd.get('level'),
+                'level': intern(gd.get('level')),
                 'message': msg
             }
 
@@ -140,24 +366,29 @@ class LogAnalyzer:
             return {
                 'log_type': 'error',
                 'timestamp': gd.get('time'),
-                'ip': client_ip,
-                'method': method,
-                'url': url,
+                'ip': intern(client_ip),
+                'method': intern(method),
+                'url': intern(url),
+                'route': self._route(url),
                 'protocol': None,
                 'status_code': None,
                 'response_size': None,
                 'referer': None,
                 'user_agent': None,
-                'level': gd.get('level'),
+                'level': intern(gd.get('level')),
                 'message': msg
             }
 
         # 4) 其他未知格式
         return None
     
-    def load_logs(self, filename: str = None, start_time: str = None, end_time: str = None, domain: str = None) -> List[Dict[str, Any]]:
-        """載入並解析log檔案，支援時間範圍和網域過濾"""
+    def load_logs(self, filename: str = None, start_time: str = None, end_time: str = None, domain: str = None,
+                  with_source: bool = False) -> List[Dict[str, Any]]:
+        """載入並解析log檔案，支援時間範圍和網域過濾；with_source 時每筆記錄加上 source_file（來源檔名）"""
         logs = []
+        # 時間範圍先在掃描階段粗篩（解碼前略過），精確條件仍由 _apply_filters 套用
+        start_epoch = self._to_epoch(start_time)
+        end_epoch = self._to_epoch(end_time)
         
         if filename:
             # 防呆：若 filename 來自表單可能是 list/tuple（甚至巢狀），取第一個有效字串
@@ -167,19 +398,21 @@ class LogAnalyzer:
                     break
             file_path = os.path.join(self.log_dir, filename)
             if os.path.exists(file_path):
-                for line in self._read_lines(file_path):
-                    parsed = self.parse_log_line(line)
-                    if parsed:
-                        logs.append(parsed)
+                self._symbols = SymbolTable()
+                source = os.path.basename(filename) if with_source else None
+                for _, parsed in self._scan_file(file_path, start_epoch, end_epoch):
+                    if source:
+                        parsed['source_file'] = source
+                    logs.append(parsed)
         else:
             # 載入所有log檔案（同時包含 access 與常見 error 副檔名）
-            for file in os.listdir(self.log_dir):
-                if file.endswith('.log') or file.endswith('.error.log') or file.endswith('.err') or file.endswith('.error'):
-                    file_path = os.path.join(self.log_dir, file)
-                    for line in self._read_lines(file_path):
-                        parsed = self.parse_log_line(line)
-                        if parsed:
-                            logs.append(parsed)
+            for file in self._list_log_files(start_epoch, end_epoch):
+                file_path = os.path.join(self.log_dir, file)
+                self._symbols = SymbolTable()
+                for _, parsed in self._scan_file(file_path, start_epoch, end_epoch):
+                    if with_source:
+                        parsed['source_file'] = file
+                    logs.append(parsed)
         
         # 應用過濾條件
         filtered_logs = self._apply_filters(logs, start_time, end_time, domain)
@@ -199,9 +432,54 @@ class LogAnalyzer:
         
         return filtered_logs
     
+    def _logs_to_frame(self, logs: List[Dict[str, Any]]) -> 'pd.DataFrame':
+        """建立統計用 DataFrame：會分組/計數的字串欄位轉為 category，value_counts/nunique 改以整數代碼運算"""
+        import pandas as pd
+        df = pd.DataFrame(logs)
+        for col in self.CATEGORY_FIELDS:
+            if col in df.columns:
+                # factorize 保留首次出現順序，使同次數項目的排序與原本一致
+                codes, uniques = pd.factorize(df[col])
+                df[col] = pd.Categorical.from_codes(codes, uniques)
+        return df
+    
+    @staticmethod
+    def _top_counts(series: 'pd.Series', n: int) -> 'pd.Series':
+        """次數遞減、同次數依首次出現順序的前 n 項（與取樣估計的排序規則相同）"""
+        return series.value_counts(sort=False).sort_values(ascending=False, kind='stable').head(n)
+
+    @staticmethod
+    def _time_range(times: 'pd.Series') -> Dict[str, Any]:
+        """最早/最晚時間以 iso_utc 輸出（無時區、到秒），與 SQLite 後端及取樣估計一致"""
+        import pandas as pd
+
+        def iso(ts):
+            if pd.isna(ts):
+                return None
+            if ts.tzinfo is not None:
+                ts = ts.tz_convert('UTC').tz_localize(None)
+            # 無時區的 Timestamp.timestamp() 以 UTC 計算
+            return iso_utc(int(ts.timestamp()))
+
+        return {'start': iso(times.min()), 'end': iso(times.max())}
+
+    @staticmethod
+    def _url_group_column(df: 'pd.DataFrame') -> str:
+        """熱門URL依路由樣板彙總；舊資料集沒有 route 欄位時退回原始 URL"""
+        if 'route' in df.columns and df['route'].notna().any():
+            return 'route'
+        return 'url'
+
     def _filter_by_time_range(self, logs: List[Dict[str, Any]], start_time: str = None, end_time: str = None) -> List[Dict[str, Any]]:
-        """根據時間範圍過濾logs"""
+        """根據時間範圍過濾logs
+
+        一律以無時區 UTC 比較：帶時區的時間轉為 UTC，無時區者（nginx error）視為 UTC，
+        與 parse_epoch 及資料集的 datetime 欄位相同，查詢時間是否帶時區都不會略過任何一種記錄。
+        """
+        import pandas as pd
         filtered_logs = []
+        start_dt = self._to_naive_utc(start_time)
+        end_dt = self._to_naive_utc(end_time)
         
         for log in logs:
             try:
@@ -219,17 +497,15 @@ class LogAnalyzer:
                     log_time = pd.to_datetime(ts, errors='coerce')
                 if pd.isna(log_time):
                     continue
+                if log_time.tzinfo is not None:
+                    log_time = log_time.tz_convert('UTC').tz_localize(None)
                 
                 # 檢查時間範圍
-                if start_time:
-                    start_dt = pd.to_datetime(start_time)
-                    if log_time < start_dt:
-                        continue
+                if start_dt is not None and log_time < start_dt:
+                    continue
                 
-                if end_time:
-                    end_dt = pd.to_datetime(end_time)
-                    if log_time > end_dt:
-                        continue
+                if end_dt is not None and log_time > end_dt:
+                    continue
                 
                 filtered_logs.append(log)
             except Exception as e:
@@ -253,11 +529,17 @@ class LogAnalyzer:
     
     def get_basic_stats(self, filename: str = None, start_time: str = None, end_time: str = None, domain: str = None) -> Dict[str, Any]:
         """取得基本統計資訊"""
+        if self.backend is not None:
+            self._sync_backend(filename)
+            return self._annotate_ips(self.backend.basic_stats(filename, self._to_epoch(start_time), self._to_epoch(end_time), domain))
+
+        import pandas as pd
+
         logs = self.load_logs(filename, start_time, end_time, domain)
         if not logs:
             return {}
             
-        df = pd.DataFrame(logs)
+        df = self._logs_to_frame(logs)
         
         # 轉換時間戳記（統一為無時區 datetime64[ns]）
         df['datetime'] = pd.to_datetime(df['timestamp'], errors='coerce', utc=True)
@@ -282,9 +564,9 @@ class LogAnalyzer:
         df['status_code'] = pd.to_numeric(df.get('status_code', 0), errors='coerce').fillna(0).astype('int64')
 
         # 產出熱門IP/URL為陣列以相容前端 slice/map
-        top_ips_counts = df['ip'].value_counts().head(10)
+        top_ips_counts = self._top_counts(df['ip'], 10)
         top_ips_list = [{ 'ip': str(ip), 'count': int(cnt) } for ip, cnt in top_ips_counts.items()]
-        top_urls_counts = df['url'].value_counts().head(10)
+        top_urls_counts = self._top_counts(df[self._url_group_column(df)], 10)
         top_urls_list = [{ 'url': str(url), 'count': int(cnt) } for url, cnt in top_urls_counts.items()]
 
         stats = {
@@ -294,22 +576,20 @@ class LogAnalyzer:
             'top_ips': top_ips_list,
             'top_urls': top_urls_list,
             'methods': {str(k): int(v) for k, v in df['method'].value_counts().to_dict().items()},
-            'time_range': {
-                'start': df['datetime'].min().isoformat(),
-                'end': df['datetime'].max().isoformat()
-            },
+            'time_range': self._time_range(df['datetime']),
             'total_bytes': int(df['response_size'].sum()),
             'avg_response_size': int(df['response_size'].mean())
         }
         
-        return stats
+        return self._annotate_ips(stats)
     
     def get_basic_stats_from_logs(self, logs: List[Dict[str, Any]]) -> Dict[str, Any]:
         """從logs列表取得基本統計資訊（內部方法）"""
+        import pandas as pd
         if not logs:
             return {}
             
-        df = pd.DataFrame(logs)
+        df = self._logs_to_frame(logs)
         
         # 轉換時間戳記（統一為無時區 datetime64[ns]）
         df['datetime'] = pd.to_datetime(df['timestamp'], errors='coerce', utc=True)
@@ -332,9 +612,9 @@ class LogAnalyzer:
         df['response_size'] = pd.to_numeric(df.get('response_size', 0), errors='coerce').fillna(0).astype('int64')
         df['status_code'] = pd.to_numeric(df.get('status_code', 0), errors='coerce').fillna(0).astype('int64')
 
-        top_ips_counts = df['ip'].value_counts().head(10)
+        top_ips_counts = self._top_counts(df['ip'], 10)
         top_ips_list = [{ 'ip': str(ip), 'count': int(cnt) } for ip, cnt in top_ips_counts.items()]
-        top_urls_counts = df['url'].value_counts().head(10)
+        top_urls_counts = self._top_counts(df[self._url_group_column(df)], 10)
         top_urls_list = [{ 'url': str(url), 'count': int(cnt) } for url, cnt in top_urls_counts.items()]
         
         stats = {
@@ -344,23 +624,182 @@ class LogAnalyzer:
             'top_ips': top_ips_list,
             'top_urls': top_urls_list,
             'methods': {str(k): int(v) for k, v in df['method'].value_counts().to_dict().items()},
-            'time_range': {
-                'start': df['datetime'].min().isoformat(),
-                'end': df['datetime'].max().isoformat()
-            },
+            'time_range': self._time_range(df['datetime']),
             'total_bytes': int(df['response_size'].sum()),
             'avg_response_size': int(df['response_size'].mean())
         }
         
-        return stats
+        return self._annotate_ips(stats)
+    
+    @staticmethod
+    def _filter_records(records, start_epoch: int = None, end_epoch: int = None, domain: str = None):
+        """對 (位移, 記錄) 串流套用精確的時間（epoch）與網域條件，yield (記錄, epoch)"""
+        check_time = start_epoch is not None or end_epoch is not None
+        needle = domain.lower() if domain else None
+        for _, rec in records:
+            ts = parse_epoch(rec.get('timestamp'))
+            if check_time and (ts is None or (start_epoch is not None and ts < start_epoch) or
+                               (end_epoch is not None and ts > end_epoch)):
+                continue
+            if needle and needle not in str(rec.get('url', '')).lower() and needle not in str(rec.get('referer', '')).lower():
+                continue
+            yield rec, ts
+
+    def _sampled_records(self, buf, offset: int, block_size: int, start_epoch: int = None,
+                         end_epoch: int = None, domain: str = None):
+        """取出起始位移落在區塊內的各行（已套用時間/網域條件），yield (記錄, epoch)"""
+        pos = offset
+        if offset > 0 and buf[offset - 1:offset] != b'\n':
+            nl = buf.find(b'\n', offset)
+            if nl == -1:
+                return
+            pos = nl + 1
+        yield from self._filter_records(self._scan_range(buf, pos, offset + block_size, start_epoch, end_epoch),
+                                        start_epoch, end_epoch, domain)
+
+    def iter_file_records(self, file_path: str, start_epoch: int = None, end_epoch: int = None, domain: str = None):
+        """串流掃描單一檔案（不保留全部記錄），yield 符合條件的 (記錄, epoch)"""
+        self._symbols = SymbolTable()
+        yield from self._filter_records(self._scan_file(file_path, start_epoch, end_epoch),
+                                        start_epoch, end_epoch, domain)
+
+    def iter_line_records(self, lines, start_epoch: int = None, end_epoch: int = None, domain: str = None):
+        """逐行解析任意來源（gzip 檔、stdin 等 bytes 或 str 行），yield 符合條件的 (記錄, epoch)"""
+        self._symbols = SymbolTable()
+
+        def parsed():
+            for line in lines:
+                if isinstance(line, bytes):
+                    line = decode_bytes(line)
+                record = self.parse_log_line(line)
+                if record:
+                    yield None, record
+
+        yield from self._filter_records(parsed(), start_epoch, end_epoch, domain)
+
+    def iter_sampled_stats(self, filename: str = None, start_time: str = None, end_time: str = None, domain: str = None,
+                           rates=DEFAULT_RATES, block_size: int = DEFAULT_BLOCK_SIZE, target_error: float = None,
+                           top_n: int = 10):
+        """以區塊取樣估計基本統計，依 rates 逐步擴大樣本並於每個階段 yield 一次估計
+
+        各階段只處理新增的區塊（低取樣率的樣本是高取樣率的子集）；取樣率為 1 時即為精確值。
+        target_error 設定時，總請求數的 95% 信賴區間半寬相對誤差低於此值即停止（至少需 MIN_STOP_BLOCKS 個區塊）。
+        """
+        start_epoch = self._to_epoch(start_time)
+        end_epoch = self._to_epoch(end_time)
+        names = [os.path.basename(filename)] if filename else self._list_log_files(start_epoch, end_epoch)
+        files = []
+        for name in names:
+            path = os.path.join(self.log_dir, name)
+            if os.path.isfile(path):
+                files.append((name, os.path.getsize(path)))
+        blocks = plan_blocks(files, block_size)
+        file_index = {name: i for i, (name, _) in enumerate(files)}
+        stats = SampledStats(len(blocks))
+        self._symbols = SymbolTable()
+        started = time.perf_counter()
+        opened = {}
+        try:
+            i = 0
+            for rate in rates:
+                while i < len(blocks) and blocks[i][0] < rate:
+                    _, name, offset = blocks[i]
+                    i += 1
+                    if name not in opened:
+                        f = open(os.path.join(self.log_dir, name), 'rb')
+                        opened[name] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                    stats.add_block(self._sampled_records(opened[name][1], offset, block_size,
+                                                          start_epoch, end_epoch, domain),
+                                    block_position(file_index[name], offset))
+                result = stats.estimate(top_n)
+                result['sampling']['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+                yield result
+                bars = result['error_bars']['total_requests']
+                enough = len(stats.blocks) >= min(MIN_STOP_BLOCKS, stats.blocks_total)
+                if target_error and enough and result['total_requests'] and bars['stderr'] is not None:
+                    if (bars['high'] - bars['estimate']) / result['total_requests'] <= target_error:
+                        break
+        finally:
+            for f, buf in opened.values():
+                buf.close()
+                f.close()
+
+    def get_sampled_stats(self, filename: str = None, start_time: str = None, end_time: str = None, domain: str = None,
+                          rate: float = 0.05, block_size: int = DEFAULT_BLOCK_SIZE) -> Dict[str, Any]:
+        """單一取樣率的快速估計"""
+        result = {}
+        for result in self.iter_sampled_stats(filename, start_time, end_time, domain, rates=(rate,), block_size=block_size):
+            pass
+        return result
+
+    def _annotate_ips(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """有 IP 資料庫時，為 top_ips / high_frequency_ips 加上 country/asn/as_org/cidr"""
+        if self.ip_enricher is None or not result:
+            return result
+        if isinstance(result.get('top_ips'), list):
+            result['top_ips'] = self.ip_enricher.annotate(result['top_ips'])
+        high_freq = result.get('high_frequency_ips')
+        if isinstance(high_freq, list):
+            result['high_frequency_ips'] = self.ip_enricher.annotate(high_freq)
+        elif isinstance(high_freq, dict):
+            result['high_frequency_ip_info'] = {ip: self.ip_enricher.lookup(str(ip)) for ip in high_freq}
+        return result
+
+    def get_ip_breakdown(self, filename: str = None, start_time: str = None, end_time: str = None, domain: str = None,
+                         top_n: int = 20) -> Dict[str, Any]:
+        """依國家 / ASN / 網段彙總請求（未設定 IP 資料庫時只有網段）"""
+        logs = self.load_logs(filename, start_time, end_time, domain)
+        if not logs:
+            return {}
+        df = self._logs_to_frame(logs)[['ip']]
+        return (self.ip_enricher or IpEnricher()).aggregate(df, top_n)
+
+    def get_partial_aggregate(self, filename: str = None, start_time: str = None, end_time: str = None, domain: str = None) -> Dict[str, Any]:
+        """產生本節點可合併的部分統計（供協調節點跨主機彙總）"""
+        logs = self.load_logs(filename, start_time, end_time, domain)
+        return PartialAggregate().add_logs(logs).to_dict()
+    
+    def get_error_templates(self, filename: str = None, start_time: str = None, end_time: str = None,
+                            top_n: int = 50) -> Dict[str, Any]:
+        """將 error 訊息依樣板彙總（次數、最早/最晚出現、範例），逐筆串流累計不保留全部記錄"""
+        start_epoch = self._to_epoch(start_time)
+        end_epoch = self._to_epoch(end_time)
+        files = [os.path.basename(filename)] if filename else self._list_log_files(start_epoch, end_epoch)
+        stats = TemplateStats()
+        for name in files:
+            file_path = os.path.join(self.log_dir, name)
+            if not os.path.exists(file_path):
+                continue
+            self._symbols = SymbolTable()
+            for _, rec in self._scan_file(file_path, start_epoch, end_epoch):
+                if rec['log_type'] != 'error':
+                    continue
+                ts = parse_epoch(rec.get('timestamp'))
+                if ts is not None and ((start_epoch is not None and ts < start_epoch) or
+                                       (end_epoch is not None and ts > end_epoch)):
+                    continue
+                stats.add(rec, ts)
+        return stats.finalize(top_n)
+
+    def get_latency_percentiles(self, filename: str = None, start_time: str = None, end_time: str = None, domain: str = None,
+                                field: str = 'request_time', bucket_seconds: int = 3600, top_n: int = 20) -> Dict[str, Any]:
+        """延遲百分位（p50/p95/p99）：整體、依 URL 與依時間桶；需自訂格式含 $request_time 等時間欄位"""
+        logs = self.load_logs(filename, start_time, end_time, domain)
+        return LatencyAggregate(field, bucket_seconds).add_logs(logs).finalize(top_n)
     
     def get_hourly_traffic(self, filename: str = None, start_time: str = None, end_time: str = None) -> Dict[str, Any]:
         """分析每小時流量"""
+        if self.backend is not None:
+            self._sync_backend(filename)
+            return self.backend.hourly_traffic(filename, self._to_epoch(start_time), self._to_epoch(end_time))
+
+        import pandas as pd
+
         logs = self.load_logs(filename, start_time, end_time)
         if not logs:
             return {}
             
-        df = pd.DataFrame(logs)
+        df = self._logs_to_frame(logs)
         df['datetime'] = pd.to_datetime(df['timestamp'], errors='coerce', utc=True)
         mask_na = df['datetime'].isna()
         if mask_na.any():
@@ -397,10 +836,11 @@ class LogAnalyzer:
     
     def analyze_hourly_traffic_from_logs(self, logs: List[Dict[str, Any]]) -> Dict[str, Any]:
         """從logs列表分析每小時流量（內部方法）"""
+        import pandas as pd
         if not logs:
             return {}
             
-        df = pd.DataFrame(logs)
+        df = self._logs_to_frame(logs)
         df['datetime'] = pd.to_datetime(df['timestamp'], errors='coerce', utc=True)
         mask_na = df['datetime'].isna()
         if mask_na.any():
@@ -438,7 +878,7 @@ class LogAnalyzer:
         if not logs:
             return {}
             
-        df = pd.DataFrame(logs)
+        df = self._logs_to_frame(logs)
         
         anomalies = {
             'high_frequency_ips': [],
@@ -478,11 +918,22 @@ class LogAnalyzer:
                 'timestamp': log['timestamp']
             })
         
-        return anomalies
+        return self._annotate_ips(anomalies)
     
     def get_logs(self, filename: str = None, start_time: str = None, end_time: str = None, 
                  domain: str = None, search: str = None, page: int = 1, page_size: int = 10, log_type: str = None) -> Dict[str, Any]:
         """取得LOG資料，支援分頁和搜尋"""
+        if self.backend is not None:
+            self._sync_backend(filename)
+            return self.backend.get_logs(filename, self._to_epoch(start_time), self._to_epoch(end_time), domain,
+                                         search, page, page_size, log_type)
+
+        # 無時間/網域/搜尋條件時，以位移索引直接讀取當頁記錄，不必解析全部檔案
+        if not (start_time or end_time or domain or search):
+            paged = self._get_logs_by_offset(filename, page, page_size, log_type)
+            if paged is not None:
+                return paged
+
         logs = self.load_logs(filename, start_time, end_time, domain)
         
         # 依 log_type 過濾（'access' 或 'error'）
@@ -516,13 +967,56 @@ class LogAnalyzer:
             'current_page': page
         }
     
+    def _get_logs_by_offset(self, filename: str, page: int, page_size: int, log_type: str = None):
+        """以位移索引分頁；任一檔案無法建立索引時回傳 None 交由一般流程處理"""
+        files = [os.path.basename(filename)] if filename else self._list_log_files()
+        if log_type in ('access', 'error', 'raw'):
+            # 與一般流程一致：'raw' 不對應任何已解析類型
+            types = [log_type] if log_type != 'raw' else []
+        else:
+            types = ['access', 'error']
+        entries = []
+        for file in files:
+            file_path = os.path.join(self.log_dir, file)
+            if not os.path.isfile(file_path):
+                continue
+            index = self._get_offset_index(file_path)
+            if index is None:
+                return None
+            offsets = index[types[0]] if len(types) == 1 else sorted(o for t in types for o in index[t])
+            entries.append((file, offsets))
+
+        total = sum(len(offsets) for _, offsets in entries)
+        start_idx = (page - 1) * page_size
+        end_idx = start_idx + page_size
+        page_logs = []
+        seen = 0
+        for file, offsets in entries:
+            lo, hi = max(start_idx - seen, 0), min(end_idx - seen, len(offsets))
+            if lo < hi:
+                page_logs.extend(self.read_records_at(file, list(offsets[lo:hi])))
+            seen += len(offsets)
+            if seen >= end_idx:
+                break
+
+        return {
+            'logs': page_logs,
+            'total': total,
+            'total_pages': (total + page_size - 1) // page_size,
+            'current_page': page
+        }
+
     def detect_anomalies(self, filename: str = None, start_time: str = None, end_time: str = None) -> Dict[str, Any]:
         """檢測異常行為"""
+        if self.backend is not None:
+            self._sync_backend(filename)
+            return self._annotate_ips(self.backend.anomalies(filename, self._to_epoch(start_time), self._to_epoch(end_time)))
+
         logs = self.load_logs(filename, start_time, end_time)
         if not logs:
             return {}
             
-        df = pd.DataFrame(logs)
+        df = self._logs_to_frame(logs)
         
         anomalies = {
             'high_frequency_ips': [],
@@ -543,14 +1037,36 @@ class LogAnalyzer:
         large_requests = df[df['response_size'] > df['response_size'].quantile(0.95)]
         anomalies['large_requests'] = large_requests[['ip', 'url', 'response_size']].to_dict('records')
         
-        return anomalies
+        return self._annotate_ips(anomalies)
     
-    def generate_charts(self, logs: List[Dict[str, Any]], time_interval: str = 'daily') -> List[str]:
-        """生成圖表（使用plotly）"""
+    def run_query(self, sql: str, params: List[Any] = None, max_rows: int = 1000) -> Dict[str, Any]:
+        """對查詢後端執行唯讀 SQL（表格: logs）"""
+        if self.backend is None:
+            raise RuntimeError('尚未啟用查詢後端（QUERY_BACKEND=sqlite）')
+        self._sync_backend()
+        return self.backend.run_readonly_query(sql, params, max_rows=max_rows)
+
+    def _write_image(self, fig, path: str):
+        """圖表先輸出到暫存檔再 os.replace，避免同時讀取到寫到一半的 PNG"""
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        fig.write_image(tmp, format='png', engine='kaleido', scale=2)
+        os.replace(tmp, path)
+
+    def generate_charts(self, logs: List[Dict[str, Any]], time_interval: str = 'daily', output_dir: str = None,
+                        traffic_range: tuple = None) -> List[str]:
+        """生成圖表（使用plotly）；output_dir 預設為分析器的輸出目錄
+
+        traffic_range=(start_time, end_time)：logs 未經檔名/網域過濾時傳入，啟用時序後流量趨勢改讀預先彙總的資料點。
+        """
+        import pandas as pd
         if not logs:
             return []
+        output_dir = output_dir or self.output_dir
+        traffic = None
+        if traffic_range is not None and self.timeseries is not None:
+            traffic = self._traffic_from_timeseries(traffic_range[0], traffic_range[1], time_interval)
             
-        df = pd.DataFrame(logs)
+        df = self._logs_to_frame(logs)
         # 圖表也改為寬鬆解析（先自動，其次 access，再 nginx error）
         df['datetime'] = pd.to_datetime(df['timestamp'], errors='coerce', utc=True)
         mask_na = df['datetime'].isna()
@@ -569,8 +1085,74 @@ class LogAnalyzer:
         df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
         df = df.dropna(subset=['datetime'])
         
-        chart_files = []
-        
+        if traffic is None:
+            series = pd.DataFrame({
+                'datetime': df['datetime'],
+                'requests': df['ip'].notna().astype('int64'),
+                'bytes': pd.to_numeric(df['response_size'], errors='coerce')
+            })
+            traffic = self._group_traffic(series, time_interval)
+        traffic_stats, title = traffic
+        top_ips = self._top_counts(df['ip'], 10).reset_index()
+        top_ips.columns = ['ip', 'count']
+        top_urls = self._top_counts(df[self._url_group_column(df)], 12).reset_index()
+        top_urls.columns = ['url', 'count']
+        return self.render_charts(traffic_stats, top_ips, top_urls, title, output_dir)
+
+    def charts_from_aggregate(self, result: Dict[str, Any], time_interval: str = 'daily', output_dir: str = None) -> List[str]:
+        """由彙總結果（PartialAggregate.finalize）產生圖表，不需保留原始記錄"""
+        import pandas as pd
+        buckets = result.get('time_buckets') or []
+        if not buckets:
+            return []
+        series = pd.DataFrame({
+            'datetime': pd.to_datetime([b['time'] for b in buckets]),
+            'requests': [b['requests'] for b in buckets],
+            'bytes': [b['bytes'] for b in buckets]
+        })
+        traffic_stats, title = self._group_traffic(series, time_interval)
+        top_ips = pd.DataFrame(result.get('top_ips') or [], columns=['ip', 'count'])
+        top_urls = pd.DataFrame((result.get('top_urls') or [])[:12], columns=['url', 'count'])
+        return self.render_charts(traffic_stats, top_ips.head(10), top_urls, title, output_dir or self.output_dir)
+
+    def _traffic_from_timeseries(self, start_time: str = None, end_time: str = None, time_interval: str = 'daily'):
+        """由時序讀取小時/日資料點再依圖表級距彙總（週/月由日資料點合併）；無資料時回傳 None"""
+        import pandas as pd
+        self._sync_timeseries()
+        step = 3600 if time_interval == 'hourly' else 86400
+        points = self.timeseries.series(self._to_epoch(start_time), self._to_epoch(end_time), step)['points']
+        if not points:
+            return None
+        series = pd.DataFrame({
+            'datetime': pd.to_datetime([p['epoch'] for p in points], unit='s'),
+            'requests': [p['requests'] for p in points],
+            'bytes': [p['bytes'] for p in points]
+        })
+        return self._group_traffic(series, time_interval)
+
+    def get_traffic_series(self, filename: str = None, start_time: str = None, end_time: str = None, domain: str = None,
+                           step: int = None, max_points: int = 2000) -> Dict[str, Any]:
+        """任意區間與級距的流量趨勢（請求數、位元組、狀態碼類別）
+
+        啟用時序且未指定檔名/網域時讀取預先彙總的資料點（step 未指定時依 max_points 自動選擇），
+        否則掃描LOG計算相同格式的結果。
+        """
+        start_epoch, end_epoch = self._to_epoch(start_time), self._to_epoch(end_time)
+        if self.timeseries is not None and not filename and not domain:
+            self._sync_timeseries()
+            result = self.timeseries.series(start_epoch, end_epoch, step, max_points)
+            result['source'] = 'timeseries'
+            return result
+        files = [os.path.basename(filename)] if filename else self._list_log_files(start_epoch, end_epoch)
+        records = (rec for name in files
+                   for rec, _ in self.iter_file_records(os.path.join(self.log_dir, name), start_epoch, end_epoch, domain))
+        result = series_from_records(records, start_epoch, end_epoch, step, max_points)
+        result['source'] = 'logs'
+        return result
+
+    @staticmethod
+    def _group_traffic(df: 'pd.DataFrame', time_interval: str = 'daily'):
+        """依時間級距彙總 datetime/requests/bytes 欄位，回傳 (time_group/requests/bytes 表, 圖表標題)"""
         # 1. Traffic trend (supports dynamic time interval)
         if time_interval == 'hourly':
             df['time_group'] = df['datetime'].dt.floor('H')
@@ -595,9 +1177,18 @@ class LogAnalyzer:
 
         # 計算流量統計
         traffic_stats = df.groupby(group_col).agg({
-            'ip': 'count',
-            'response_size': 'sum'
-        }).rename(columns={'ip': 'requests', 'response_size': 'bytes'}).reset_index()
+            'requests': 'sum',
+            'bytes': 'sum'
+        }).reset_index()
+        return traffic_stats, title
+
+    def render_charts(self, traffic_stats: 'pd.DataFrame', top_ips: 'pd.DataFrame', top_urls: 'pd.DataFrame',
+                      title: str, output_dir: str) -> List[str]:
+        """輸出流量趨勢、熱門IP與熱門URL三張圖表"""
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+        group_col = 'time_group'
+        chart_files = []
 
         # Create dual-axis figure
         fig = make_subplots(specs=[[{"secondary_y": True}]])
@@ -657,14 +1248,11 @@ class LogAnalyzer:
         )
 
         # 儲存圖表
-        traffic_chart = os.path.join(self.output_dir, 'traffic_trend.png')
-        fig.write_image(traffic_chart, format='png', engine='kaleido', scale=2)
+        traffic_chart = os.path.join(output_dir, 'traffic_trend.png')
+        self._write_image(fig, traffic_chart)
         chart_files.append(traffic_chart)
 
         # 2. Top IPs
-        top_ips = df['ip'].value_counts().head(10).reset_index()
-        top_ips.columns = ['ip', 'count']
-
         fig_ip = go.Figure()
         fig_ip.add_trace(
             go.Bar(
@@ -696,16 +1284,14 @@ class LogAnalyzer:
             margin=dict(l=100, r=60, t=80, b=60)
         )
 
-        ips_chart = os.path.join(self.output_dir, 'top_ips.png')
-        fig_ip.write_image(ips_chart, format='png', engine='kaleido', scale=2)
+        ips_chart = os.path.join(output_dir, 'top_ips.png')
+        self._write_image(fig_ip, ips_chart)
         chart_files.append(ips_chart)
 
         # 3. Top URLs
-        top_urls = df['url'].value_counts().head(12).reset_index()
-        top_urls.columns = ['url', 'count']
-
         # 截斷過長的URL
-        top_urls['display_url'] = top_urls['url'].apply(lambda x: x[:40] + '...' if len(x) > 40 else x)
+        top_urls = top_urls.copy()
+        top_urls['display_url'] = top_urls['url'].astype(str).apply(lambda x: x[:40] + '...' if len(x) > 40 else x)
 
         fig_url = go.Figure()
         fig_url.add_trace(
@@ -738,14 +1324,100 @@ class LogAnalyzer:
             margin=dict(l=200, r=60, t=80, b=60)
         )
 
-        urls_chart = os.path.join(self.output_dir, 'top_urls.png')
-        fig_url.write_image(urls_chart, format='png', engine='kaleido', scale=2)
+        urls_chart = os.path.join(output_dir, 'top_urls.png')
+        self._write_image(fig_url, urls_chart)
         chart_files.append(urls_chart)
         
         return chart_files
     
-    def export_results(self, logs: List[Dict[str, Any]], filename: str = "analysis_results.json"):
-        """匯出分析結果"""
+    def _to_naive_utc(self, value):
+        """將查詢時間轉為與 datetime 欄位一致的無時區 UTC Timestamp。"""
+        if not value:
+            return None
+        import pandas as pd
+        ts = pd.to_datetime(value)
+        if ts.tzinfo is not None:
+            ts = ts.tz_convert('UTC').tz_localize(None)
+        return ts
+
+    def _with_datetime(self, logs: List[Dict[str, Any]]) -> 'pd.DataFrame':
+        """建立 DataFrame 並加入無時區 datetime 欄位（與統計方法相同的寬鬆解析）。"""
+        import pandas as pd
+        df = pd.DataFrame(logs)
+        # 先以已知格式向量化解析（access、nginx error），剩餘者才走自動解析
+        df['datetime'] = pd.to_datetime(df['timestamp'], format='%d/%b/%Y:%H:%M:%S %z', errors='coerce', utc=True)
+        mask_na = df['datetime'].isna()
+        if mask_na.any():
+            df.loc[mask_na, 'datetime'] = pd.to_datetime(df.loc[mask_na, 'timestamp'], format='%Y/%m/%d %H:%M:%S', errors='coerce', utc=True)
+        mask_na = df['datetime'].isna() & df['timestamp'].notna()
+        if mask_na.any():
+            df.loc[mask_na, 'datetime'] = pd.to_datetime(df.loc[mask_na, 'timestamp'], format='mixed', errors='coerce', utc=True)
+        df['datetime'] = df['datetime'].dt.tz_convert(None)
+        return df
+
+    def export_dataset(self, logs: List[Dict[str, Any]], fmt: str = 'parquet', source_file: str = None,
+                       part_name: str = None) -> List[str]:
+        """將解析後記錄寫成依日期與 log_type 分區的 Parquet / Arrow IPC 檔案
+
+        記錄本身帶有 source_file 時依來源檔分開寫出；未指定 part_name 時檔名由來源檔決定，
+        寫出前先刪除該來源先前匯出的檔案，因此每個來源檔的記錄必須是完整（未過濾）的。
+        """
+        if not logs:
+            return []
+        df = self._with_datetime(logs)
+        if source_file is not None or 'source_file' not in df.columns:
+            df['source_file'] = source_file
+        base_dir = log_store.dataset_path(self.output_dir, fmt)
+        if part_name:
+            return log_store.write_dataset(df, base_dir, fmt, part_name)
+        if df['source_file'].isna().any():
+            raise ValueError('匯出資料集需要來源檔名（source_file），否則重新匯出時無法取代舊資料')
+        written = []
+        for source, group in df.groupby('source_file', sort=False):
+            name = log_store.source_part_name(source)
+            log_store.remove_parts(base_dir, name)
+            written += log_store.write_dataset(group, base_dir, fmt, name)
+        return written
+
+    def load_dataset(self, start_time: str = None, end_time: str = None, domain: str = None,
+                     log_type: str = None, columns: List[str] = None, fmt: str = 'parquet',
+                     as_frame: bool = False, filename: str = None):
+        """從欄式資料集載入記錄（欄位投影 + 述詞下推），免重新解析文字LOG；filename 只載入該來源檔"""
+        import pandas as pd
+        df = log_store.read_dataset(
+            log_store.dataset_path(self.output_dir, fmt),
+            fmt=fmt,
+            columns=columns,
+            start=self._to_naive_utc(start_time),
+            end=self._to_naive_utc(end_time),
+            log_type=log_type,
+            source_file=os.path.basename(filename) if filename else None
+        )
+        if domain and len(df):
+            needle = domain.lower()
+            hit = pd.Series(False, index=df.index)
+            for col in ('url', 'referer'):
+                if col in df.columns:
+                    hit |= df[col].fillna('').str.lower().str.contains(needle, regex=False)
+            df = df[hit]
+        if as_frame:
+            return df
+        return log_store.records_from_frame(df)
+
+    def warm_up(self, charts: bool = True):
+        """預先載入分析與繪圖模組；charts=True 時另以極小圖表啟動 kaleido
+
+        kaleido 會啟動常駐子行程，不能跨 fork 共用，charts=True 應在 worker 內呼叫。
+        """
+        import pandas  # noqa: F401
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots  # noqa: F401
+        if charts:
+            go.Figure(go.Scatter(x=[0, 1], y=[0, 1])).to_image(format='png', engine='kaleido', width=10, height=10)
+
+    def export_results(self, logs: List[Dict[str, Any]], filename: str = "analysis_results.json",
+                       output_dir: str = None, extra: Dict[str, Any] = None):
+        """匯出分析結果（寫入暫存檔後原子替換）；extra 會併入結果（例如報表區間資訊）"""
         stats = self.get_basic_stats_from_logs(logs)
         hourly = self.analyze_hourly_traffic_from_logs(logs)
         anomalies = self.detect_anomalies_from_logs(logs)
@@ -756,22 +1428,36 @@ class LogAnalyzer:
             'anomalies': anomalies,
             'generated_at': datetime.now().isoformat()
         }
+        if extra:
+            results.update(extra)
         
-        output_file = os.path.join(self.output_dir, filename)
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
+        output_file = os.path.join(output_dir or self.output_dir, filename)
+        write_json_atomic(output_file, results)
         
         return output_file
     
-    def run_full_analysis(self, log_filename: str = None, start_time: str = None, end_time: str = None, domain: str = None, time_interval: str = 'daily'):
-        """執行完整分析，支援時間範圍和網域過濾"""
+    def run_full_analysis(self, log_filename: str = None, start_time: str = None, end_time: str = None, domain: str = None, time_interval: str = 'daily',
+                          export_format: str = None, source: str = 'logs'):
+        """執行完整分析，支援時間範圍和網域過濾
+
+        export_format: 'parquet' / 'arrow' 時，另將解析後記錄持久化為欄式資料集
+        source: 'dataset' 時改由先前匯出的資料集載入（不重新解析文字LOG）
+        """
         print("開始載入LOG檔案...")
         # 防呆 normalize
         while isinstance(log_filename, (list, tuple)):
             log_filename = log_filename[0] if log_filename else None
             if log_filename is None:
                 break
-        logs = self.load_logs(log_filename, start_time, end_time, domain)
+        complete = None
+        if source == 'dataset':
+            logs = self.load_dataset(start_time, end_time, domain, fmt=export_format or 'parquet', filename=log_filename)
+        elif export_format:
+            # 資料集以來源檔為單位整份取代：匯出帶來源檔名的完整記錄，分析時才套用時間/網域條件
+            complete = self.load_logs(log_filename, with_source=True)
+            logs = self._apply_filters(complete, start_time, end_time, domain)
+        else:
+            logs = self.load_logs(log_filename, start_time, end_time, domain)
         
         if not logs:
             print("未找到有效的LOG資料")
@@ -801,10 +1487,17 @@ class LogAnalyzer:
         anomalies = self.detect_anomalies_from_logs(logs)
         
         print(f"生成圖表 (時間級距: {time_interval})...")
-        charts = self.generate_charts(logs, time_interval)
+        # 未指定檔名/網域時，流量趨勢可由時序的預先彙總資料點產生
+        traffic_range = (start_time, end_time) if source != 'dataset' and not log_filename and not domain else None
+        charts = self.generate_charts(logs, time_interval, traffic_range=traffic_range)
         
         print("匯出結果...")
         results_file = self.export_results(logs)
+
+        dataset_files = []
+        if complete:
+            print(f"匯出欄式資料集 ({export_format})...")
+            dataset_files = self.export_dataset(complete, export_format)
         
         print(f"分析完成！結果已儲存至: {results_file}")
         print(f"圖表檔案類型: {type(charts)}")
@@ -820,6 +1513,7 @@ class LogAnalyzer:
             'anomalies': anomalies,
             'charts': charts,
             'results_file': results_file,
+            'dataset_files': dataset_files,
             'filters': {
                 'start_time': start_time,
                 'end_time': end_time,
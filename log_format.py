@@ -0,0 +1,251 @@
+import re
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+
+def _to_int(value: str) -> Optional[int]:
+    if value in ('', '-'):
+        return None
+    return int(value)
+
+
+def _to_float(value: str) -> Optional[float]:
+    if value in ('', '-'):
+        return None
+    return float(value)
+
+
+def _to_seconds_sum(value: str) -> Optional[float]:
+    """upstream 時間可能是多段（'0.010, 0.020' 或 '0.010 : 0.020'），加總為總秒數"""
+    parts = [p for p in re.split(r'[,:\s]+', value or '') if p and p != '-']
+    if not parts:
+        return None
+    return round(sum(float(p) for p in parts), 6)
+
+
+def _micros_to_seconds(value: str) -> Optional[float]:
+    v = _to_int(value)
+    return None if v is None else v / 1_000_000
+
+
+def _millis_to_seconds(value: str) -> Optional[float]:
+    v = _to_int(value)
+    return None if v is None else v / 1000
+
+
+_NUM = r'\d+|-'
+_FLOAT = r'\d+(?:\.\d+)?|-'
+_MULTI_FLOAT = r'(?:\d+(?:\.\d+)?|-)(?:(?:, | : )(?:\d+(?:\.\d+)?|-))*'
+
+# nginx 變數 -> (欄位名稱, 正則, 轉換函式)；正則為 None 時依前後文（引號/中括號）決定
+NGINX_VARIABLES: Dict[str, Tuple[str, Optional[str], Optional[Callable]]] = {
+    'remote_addr': ('ip', r'\S+', None),
+    'binary_remote_addr': ('ip', r'\S+', None),
+    'realip_remote_addr': ('ip', r'\S+', None),
+    'remote_user': ('remote_user', r'\S+', None),
+    'time_local': ('timestamp', r'[^\]]+', None),
+    'time_iso8601': ('timestamp', r'\S+', None),
+    'msec': ('msec', _FLOAT, _to_float),
+    'request': ('request', None, None),
+    'request_method': ('method', r'[A-Z]+', None),
+    'request_uri': ('url', r'\S+', None),
+    'uri': ('url', r'\S+', None),
+    'server_protocol': ('protocol', r'\S+', None),
+    'status': ('status_code', r'\d{3}', int),
+    'body_bytes_sent': ('response_size', _NUM, _to_int),
+    'bytes_sent': ('bytes_sent', _NUM, _to_int),
+    'request_length': ('request_length', _NUM, _to_int),
+    'request_time': ('request_time', _FLOAT, _to_float),
+    'upstream_response_time': ('upstream_response_time', _MULTI_FLOAT, _to_seconds_sum),
+    'upstream_connect_time': ('upstream_connect_time', _MULTI_FLOAT, _to_seconds_sum),
+    'upstream_header_time': ('upstream_header_time', _MULTI_FLOAT, _to_seconds_sum),
+    'http_referer': ('referer', None, None),
+    'http_user_agent': ('user_agent', None, None),
+    'http_x_forwarded_for': ('x_forwarded_for', None, None),
+    'host': ('host', r'\S+', None),
+    'http_host': ('host', r'\S+', None),
+    'server_name': ('host', r'\S+', None),
+    'upstream_addr': ('upstream_addr', None, None),
+    'pipe': ('pipe', r'[p.]', None),
+    'connection': ('connection', _NUM, _to_int),
+    'connection_requests': ('connection_requests', _NUM, _to_int),
+}
+
+# Apache LogFormat 指令 -> (欄位名稱, 正則, 轉換函式)
+APACHE_DIRECTIVES: Dict[str, Tuple[str, Optional[str], Optional[Callable]]] = {
+    'h': ('ip', r'\S+', None),
+    'a': ('ip', r'\S+', None),
+    'l': ('ident', r'\S+', None),
+    'u': ('remote_user', r'\S+', None),
+    't': ('timestamp', r'\[[^\]]+\]', None),
+    'r': ('request', None, None),
+    'm': ('method', r'[A-Z]+', None),
+    'U': ('url', r'\S+', None),
+    'H': ('protocol', r'\S+', None),
+    's': ('status_code', r'\d{3}', int),
+    'b': ('response_size', _NUM, _to_int),
+    'B': ('response_size', _NUM, _to_int),
+    'O': ('bytes_sent', _NUM, _to_int),
+    'I': ('request_length', _NUM, _to_int),
+    'D': ('request_time', _NUM, _micros_to_seconds),
+    'T': ('request_time', _NUM, _to_float),
+    'v': ('host', r'\S+', None),
+    'V': ('host', r'\S+', None),
+}
+
+APACHE_HEADERS = {
+    'referer': 'referer',
+    'user-agent': 'user_agent',
+    'host': 'host',
+    'x-forwarded-for': 'x_forwarded_for',
+}
+
+
+def _context_regex(next_char: str) -> str:
+    """未指定型別的字串欄位：依下一個字元決定可匹配範圍"""
+    if next_char == '"':
+        return r'[^"]*'
+    if next_char == ']':
+        return r'[^\]]*'
+    if next_char == '':
+        return r'.*'
+    return r'\S*'
+
+
+class CompiledFormat:
+    """由 log_format / LogFormat 產生的解析器：單一預先編譯的正則 + 型別轉換"""
+
+    def __init__(self, source: str, tokens: List[Tuple[str, Any]]):
+        self.source = source
+        parts = []
+        self.fields: List[Tuple[str, str, Optional[Callable]]] = []
+        used = {}
+        for i, (kind, value) in enumerate(tokens):
+            if kind == 'literal':
+                # 空白視為彈性分隔（一個以上）
+                parts.append(r'\s+'.join(re.escape(p) for p in re.split(r' +', value)))
+                continue
+            name, pattern, conv = value
+            next_char = ''
+            if i + 1 < len(tokens) and tokens[i + 1][0] == 'literal':
+                next_char = tokens[i + 1][1][:1]
+            if pattern is None:
+                pattern = _context_regex(next_char)
+            count = used.get(name, 0)
+            used[name] = count + 1
+            group = f'{name}__{count}' if count else name
+            if name == 'timestamp' and pattern.startswith(r'\['):
+                # Apache %t 含中括號：只擷取括號內文字
+                parts.append(r'\[(?P<%s>[^\]]+)\]' % group)
+            else:
+                parts.append(f'(?P<{group}>{pattern})')
+            self.fields.append((group, name, conv))
+        self.pattern = ''.join(parts)
+        self.regex = re.compile(self.pattern)
+        self.regex_bytes = re.compile(self.pattern.encode('utf-8'))
+        self.field_names = [name for _, name, _ in self.fields]
+
+    def _build(self, get: Callable[[str], str]) -> Dict[str, Any]:
+        record = {'log_type': 'access'}
+        for group, name, conv in self.fields:
+            if name in record and record[name] is not None:
+                continue
+            raw = get(group)
+            if raw is None:
+                continue
+            try:
+                record[name] = conv(raw) if conv else raw
+            except ValueError:
+                record[name] = None
+        request = record.pop('request', None)
+        if request is not None:
+            parts = request.split()
+            record.setdefault('method', parts[0] if len(parts) > 0 else None)
+            record.setdefault('url', parts[1] if len(parts) > 1 else None)
+            record.setdefault('protocol', parts[2] if len(parts) > 2 else None)
+        for key in ('ip', 'timestamp', 'method', 'url', 'protocol', 'status_code', 'response_size', 'referer', 'user_agent'):
+            record.setdefault(key, None)
+        if record.get('response_size') is None:
+            # Apache %b 以 '-' 表示 0 bytes；與預設格式一致維持整數
+            record['response_size'] = 0
+        return record
+
+    def parse(self, line: str) -> Optional[Dict[str, Any]]:
+        m = self.regex.match(line)
+        if not m:
+            return None
+        return self._build(m.group)
+
+    def record_from_bytes_match(self, m, decode: Callable[[bytes], str]) -> Dict[str, Any]:
+        def get(group):
+            raw = m.group(group)
+            return None if raw is None else decode(raw)
+        return self._build(get)
+
+
+def _tokenize_nginx(fmt: str):
+    tokens = []
+    pos = 0
+    for m in re.finditer(r'\$(?:\{(\w+)\}|(\w+))', fmt):
+        if m.start() > pos:
+            tokens.append(('literal', fmt[pos:m.start()]))
+        var = m.group(1) or m.group(2)
+        # 未知變數（含 $http_*、$cookie_* 等）以字串欄位保留原名
+        tokens.append(('field', NGINX_VARIABLES.get(var, (var, None, None))))
+        pos = m.end()
+    if pos < len(fmt):
+        tokens.append(('literal', fmt[pos:]))
+    return tokens
+
+
+def _tokenize_apache(fmt: str):
+    tokens = []
+    pos = 0
+    literal = []
+    pattern = re.compile(r'%(?:[<>]|!?\d{3}(?:,\d{3})*)?(?:\{([^}]*)\})?([a-zA-Z%])')
+    while pos < len(fmt):
+        m = pattern.match(fmt, pos)
+        if not m:
+            literal.append(fmt[pos])
+            pos += 1
+            continue
+        arg, directive = m.group(1), m.group(2)
+        pos = m.end()
+        if directive == '%':
+            literal.append('%')
+            continue
+        if literal:
+            tokens.append(('literal', ''.join(literal)))
+            literal = []
+        if directive == 'i' and arg is not None:
+            name = APACHE_HEADERS.get(arg.lower(), 'header_' + re.sub(r'\W', '_', arg.lower()))
+            tokens.append(('field', (name, None, None)))
+        elif directive == 'T' and arg in ('ms', 'us', 's'):
+            conv = {'ms': _millis_to_seconds, 'us': _micros_to_seconds, 's': _to_float}[arg]
+            tokens.append(('field', ('request_time', _NUM, conv)))
+        elif directive == 't' and arg:
+            # 自訂時間格式：以中括號內文字擷取
+            tokens.append(('field', ('timestamp', None, None)))
+        elif directive in APACHE_DIRECTIVES:
+            tokens.append(('field', APACHE_DIRECTIVES[directive]))
+        else:
+            tokens.append(('field', (f'apache_{directive}', None, None)))
+    if literal:
+        tokens.append(('literal', ''.join(literal)))
+    return tokens
+
+
+def compile_format(fmt: str, style: str = 'nginx') -> CompiledFormat:
+    """編譯 nginx log_format 或 Apache LogFormat 字串
+
+    nginx 設定檔中的多段字串（'...' '...'）需先串接為單一字串。
+    """
+    style = (style or 'nginx').lower()
+    if style == 'nginx':
+        tokens = _tokenize_nginx(fmt)
+    elif style == 'apache':
+        tokens = _tokenize_apache(fmt)
+    else:
+        raise ValueError(f'不支援的格式類型: {style}（可用: nginx, apache）')
+    if not any(kind == 'field' for kind, _ in tokens):
+        raise ValueError('格式字串中沒有任何欄位')
+    return CompiledFormat(fmt, tokens)
@@ -0,0 +1,188 @@
+import os
+import glob
+import hashlib
+from typing import List, Dict, Any, Optional
+
+
+# 欄式資料集的欄位與型別（log_type/date 為分區欄位，不寫入檔案本體）
+DATASET_COLUMNS = [
+    'ip', 'timestamp', 'datetime', 'method', 'url', 'route', 'protocol',
+    'status_code', 'response_size', 'referer', 'user_agent',
+    'level', 'message', 'host', 'request_time', 'upstream_response_time', 'source_file'
+]
+PARTITION_COLUMNS = ['log_type', 'date']
+SUPPORTED_FORMATS = {
+    'parquet': 'parquet',
+    'arrow': 'ipc',
+    'ipc': 'ipc',
+    'feather': 'ipc',
+}
+
+
+def _require_pyarrow():
+    """延遲載入 pyarrow，未安裝時給出明確訊息。"""
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.dataset  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError('Parquet/Arrow 功能需要安裝 pyarrow（pip install pyarrow）') from e
+    return pyarrow
+
+
+def _normalize_format(fmt: str) -> str:
+    fmt = (fmt or 'parquet').lower()
+    if fmt not in SUPPORTED_FORMATS:
+        raise ValueError(f'不支援的格式: {fmt}（可用: {", ".join(sorted(SUPPORTED_FORMATS))}）')
+    return SUPPORTED_FORMATS[fmt]
+
+
+def _schema():
+    pa = _require_pyarrow()
+    return pa.schema([
+        ('ip', pa.string()),
+        ('timestamp', pa.string()),
+        ('datetime', pa.timestamp('us')),
+        ('method', pa.string()),
+        ('url', pa.string()),
+        ('route', pa.string()),
+        ('protocol', pa.string()),
+        ('status_code', pa.int32()),
+        ('response_size', pa.int64()),
+        ('referer', pa.string()),
+        ('user_agent', pa.string()),
+        ('level', pa.string()),
+        ('message', pa.string()),
+        ('host', pa.string()),
+        ('request_time', pa.float64()),
+        ('upstream_response_time', pa.float64()),
+        ('source_file', pa.string()),
+        ('log_type', pa.string()),
+        ('date', pa.string()),
+    ])
+
+
+def _partitioning():
+    pa = _require_pyarrow()
+    import pyarrow.dataset as ds
+    return ds.partitioning(pa.schema([('log_type', pa.string()), ('date', pa.string())]), flavor='hive')
+
+
+def write_dataset(df, base_dir: str, fmt: str, part_name: str) -> List[str]:
+    """將已含 datetime 欄位的 DataFrame 依 log_type/date 分區寫出，回傳新產生的檔案清單。
+
+    採 hive 風格目錄（log_type=access/date=2025-09-24/part-*.parquet），
+    可直接以 pandas.read_parquet 或 DuckDB read_parquet(..., hive_partitioning=1) 讀取。
+    檔名為 part-<part_name>-<序號>：以同一 part_name 重複寫入會覆蓋同名檔案而不會重複。
+    """
+    pa = _require_pyarrow()
+    import pyarrow.dataset as ds
+    file_format = _normalize_format(fmt)
+    if df is None or len(df) == 0:
+        return []
+
+    df = df.copy()
+    for col in DATASET_COLUMNS + ['log_type']:
+        if col not in df.columns:
+            df[col] = None
+    # 無法解析時間的記錄放在 date=unknown 分區，避免資料遺失
+    df['date'] = df['datetime'].dt.strftime('%Y-%m-%d').fillna('unknown')
+    df['log_type'] = df['log_type'].fillna('unknown')
+
+    schema = _schema()
+    table = pa.Table.from_pandas(df[[f.name for f in schema]], schema=schema, preserve_index=False)
+
+    os.makedirs(base_dir, exist_ok=True)
+    extension = 'parquet' if file_format == 'parquet' else 'arrow'
+    written = []
+    ds.write_dataset(
+        table,
+        base_dir,
+        format=file_format,
+        partitioning=_partitioning(),
+        basename_template=f'part-{part_name}-{{i}}.{extension}',
+        existing_data_behavior='overwrite_or_ignore',
+        file_visitor=lambda f: written.append(f.path),
+    )
+    return written
+
+
+def source_part_name(source_file: str) -> str:
+    """依來源檔名決定固定的檔名前綴：同一來源重新匯出時取代各分區中的舊檔而非重複寫入"""
+    return 'src-' + hashlib.sha1(source_file.encode('utf-8')).hexdigest()[:16]
+
+
+def remove_parts(base_dir: str, part_name: str) -> int:
+    """刪除各分區中以 part_name 為前綴的檔案（write_dataset 以同一 part_name 寫出者），回傳刪除數"""
+    removed = 0
+    for path in glob.glob(os.path.join(glob.escape(base_dir), '*', '*', f'part-{part_name}-*')):
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
+
+
+def _build_filter(start=None, end=None, log_type: Optional[str] = None, source_file: Optional[str] = None):
+    """組出 pyarrow 過濾運算式；date 分區條件可直接略過整個目錄。"""
+    import pyarrow.dataset as ds
+    expr = None
+
+    def _and(a, b):
+        return b if a is None else (a & b)
+
+    if log_type:
+        expr = _and(expr, ds.field('log_type') == log_type)
+    if source_file:
+        expr = _and(expr, ds.field('source_file') == source_file)
+    if start is not None:
+        expr = _and(expr, ds.field('date') >= start.strftime('%Y-%m-%d'))
+        expr = _and(expr, ds.field('datetime') >= start.to_pydatetime())
+    if end is not None:
+        expr = _and(expr, ds.field('date') <= end.strftime('%Y-%m-%d'))
+        expr = _and(expr, ds.field('datetime') <= end.to_pydatetime())
+    return expr
+
+
+def read_dataset(base_dir: str, fmt: str = 'parquet', columns: Optional[List[str]] = None,
+                 start=None, end=None, log_type: Optional[str] = None, source_file: Optional[str] = None):
+    """以欄位投影與述詞下推讀取分區資料集，回傳 pandas DataFrame。
+
+    start/end 為無時區的 pandas.Timestamp（與 datetime 欄位一致）；source_file 只讀取該來源檔的記錄。
+    """
+    _require_pyarrow()
+    import pyarrow.dataset as ds
+    import pandas as pd
+    file_format = _normalize_format(fmt)
+    if not os.path.isdir(base_dir):
+        return pd.DataFrame(columns=columns or DATASET_COLUMNS + PARTITION_COLUMNS)
+
+    dataset = ds.dataset(base_dir, format=file_format, partitioning=_partitioning(),
+                         exclude_invalid_files=True)
+    if columns:
+        unknown = [c for c in columns if c not in dataset.schema.names]
+        if unknown:
+            raise ValueError(f'未知欄位: {", ".join(unknown)}')
+    table = dataset.to_table(columns=columns, filter=_build_filter(start, end, log_type, source_file))
+    return table.to_pandas()
+
+
+def dataset_path(output_dir: str, fmt: str = 'parquet') -> str:
+    """資料集根目錄：Parquet 與 Arrow IPC 分開存放，避免混讀。"""
+    file_format = _normalize_format(fmt)
+    return os.path.join(output_dir, 'dataset', 'parquet' if file_format == 'parquet' else 'arrow')
+
+
+def records_from_frame(df) -> List[Dict[str, Any]]:
+    """將資料集 DataFrame 轉回 load_logs 相同格式的記錄（NaN → None）。"""
+    import pandas as pd
+    if df is None or len(df) == 0:
+        return []
+    out = df.drop(columns=[c for c in ('datetime', 'date', 'source_file') if c in df.columns])
+    out = out.astype(object).where(pd.notna(out), None)
+    records = out.to_dict('records')
+    for rec in records:
+        for key in ('status_code', 'response_size'):
+            if rec.get(key) is not None:
+                rec[key] = int(rec[key])
+    return records
@@ -0,0 +1,91 @@
+import os
+import json
+import time
+import threading
+from functools import lru_cache
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+
+def parse_epoch(ts: Optional[str]) -> Optional[int]:
+    """將 access / nginx error 時間字串轉為 UTC epoch 秒；無法解析時回傳 None。"""
+    if not ts:
+        return None
+    try:
+        return int(datetime.strptime(ts, '%d/%b/%Y:%H:%M:%S %z').timestamp())
+    except ValueError:
+        pass
+    for fmt in ('%Y/%m/%d %H:%M:%S', '%a %b %d %H:%M:%S.%f %Y'):
+        try:
+            return int(datetime.strptime(ts, fmt).replace(tzinfo=timezone.utc).timestamp())
+        except ValueError:
+            continue
+    # nginx $time_iso8601
+    try:
+        dt = datetime.fromisoformat(ts)
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+@lru_cache(maxsize=8192)
+def _cached_epoch(ts: str) -> Optional[int]:
+    return parse_epoch(ts)
+
+
+def record_epoch(ts: Optional[str]) -> Optional[int]:
+    """與 parse_epoch 相同，但 access / nginx error 時間以「分鐘」為快取鍵再加上秒數，避免每行都 strptime"""
+    if not ts:
+        return None
+    if len(ts) == 26 and ts[2] == '/' and ts[20] == ' ' and ts[18:20].isdigit():
+        base = _cached_epoch(ts[:18] + '00' + ts[20:])
+        return None if base is None else base + int(ts[18:20])
+    if len(ts) == 19 and ts[4] == '/' and ts[17:19].isdigit():
+        base = _cached_epoch(ts[:17] + '00')
+        return None if base is None else base + int(ts[17:19])
+    return _cached_epoch(ts)
+
+
+def iso_utc(epoch: Optional[int]) -> Optional[str]:
+    """epoch 秒轉為不帶時區的 UTC ISO 字串（與 get_basic_stats 的 time_range 相同格式）"""
+    if epoch is None:
+        return None
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def decode_bytes(raw: bytes) -> str:
+    """依序嘗試 utf-8、cp950、big5，皆失敗時以 latin-1 解碼"""
+    for enc in ('utf-8', 'cp950', 'big5'):
+        try:
+            return raw.decode(enc)
+        except UnicodeDecodeError:
+            continue
+    return raw.decode('latin-1', errors='ignore')
+
+
+# 檔尾沒有換行的最後一行：檔案超過此秒數未再變動即視為已寫完
+TAIL_SETTLE_SECONDS = 2.0
+
+
+def tail_settled(st: os.stat_result, prev_size: int = None, prev_mtime: float = None) -> bool:
+    """檔尾未以換行結束時，最後一行是否可視為完整：大小與 mtime 與上次同步相同，或已一段時間未變動"""
+    if prev_size == st.st_size and prev_mtime == st.st_mtime:
+        return True
+    return time.time() - st.st_mtime >= TAIL_SETTLE_SECONDS
+
+
+def complete_end(buf, start: int, end: int, settled: bool) -> int:
+    """[start, end) 中可處理到的位移：最後一個換行之後；檔尾已穩定時包含未以換行結束的最後一行"""
+    if settled:
+        return end
+    return buf.rfind(b'\n', start, end) + 1 or start
+
+
+def write_json_atomic(path: str, data: Any):
+    """先寫入同目錄暫存檔再 os.replace，讀取端只會看到完整的舊檔或新檔"""
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
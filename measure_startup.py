@@ -0,0 +1,79 @@
+"""量測冷啟動：app 模組載入時間與服務啟動到 /health 回應的時間
+
+用法：python measure_startup.py [--runs 5] [--server gunicorn|flask]
+結果以 JSON 輸出到 stdout。
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import app; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def measure_import(env) -> float:
+    out = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], cwd=HERE, env=env,
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def measure_health(server: str, env, timeout: float = 60.0) -> float:
+    port = _free_port()
+    if server == 'gunicorn':
+        cmd = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', 'app:app']
+    else:
+        cmd = [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port)]
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError(f'{server} 在 {timeout} 秒內未回應 /health')
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='量測冷啟動與 /health 就緒時間')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--server', choices=['gunicorn', 'flask'], default='gunicorn')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault('LOG_DIR', os.path.join(HERE, 'logs'))
+    env.setdefault('OUTPUT_DIR', os.path.join(HERE, 'output'))
+
+    imports = [measure_import(env) for _ in range(args.runs)]
+    health = [measure_health(args.server, env) for _ in range(args.runs)]
+    print(json.dumps({
+        'runs': args.runs,
+        'server': args.server,
+        'import_app_seconds': {'median': round(statistics.median(imports), 3), 'max': round(max(imports), 3)},
+        'time_to_health_seconds': {'median': round(statistics.median(health), 3), 'max': round(max(health), 3)},
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,422 @@
+import math
+import heapq
+import base64
+import hashlib
+from collections import Counter
+from typing import List, Dict, Any, Optional, Iterable
+
+from log_utils import parse_epoch, iso_utc
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8', errors='ignore'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """可合併的基數估計（唯一IP數），標準誤約 1.04 / sqrt(2^p)"""
+
+    def __init__(self, p: int = 12, registers: Optional[bytearray] = None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = registers if registers is not None else bytearray(self.m)
+
+    def add(self, value: str):
+        x = _hash64(value)
+        idx = x >> (64 - self.p)
+        rest = x & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other: 'HyperLogLog'):
+        if other.p != self.p:
+            raise ValueError('HyperLogLog 精度不同，無法合併')
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def estimate(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # 小基數時改用 linear counting
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'p': self.p, 'registers': base64.b64encode(bytes(self.registers)).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'HyperLogLog':
+        return cls(int(data['p']), bytearray(base64.b64decode(data['registers'])))
+
+
+class HeavyHitters:
+    """Misra-Gries 熱門項目摘要：最多保留 capacity 個計數器，可合併
+
+    計數只會少算不會多算；共處理 N 次時每個計數最多少算 N/(capacity+1)，
+    出現次數超過此值的項目一定保留。相異值不超過 capacity 時為精確值。
+    """
+
+    def __init__(self, capacity: int = 1000, counts: Optional[Dict[str, int]] = None):
+        self.capacity = capacity
+        self.counts = Counter(counts or {})
+
+    def update(self, counts: Dict[str, int]):
+        self.counts.update(counts)
+        self._compact()
+
+    def merge(self, other: 'HeavyHitters'):
+        # 兩份摘要相加後再扣除第 capacity+1 大的計數，誤差上限仍以總次數計
+        self.update(other.counts)
+
+    def _compact(self):
+        """計數器超過容量時全部減去第 capacity+1 大的計數並移除歸零者（一次處理多次的遞減步驟）"""
+        if len(self.counts) <= self.capacity:
+            return
+        cut = heapq.nlargest(self.capacity + 1, self.counts.values())[-1]
+        self.counts = Counter({k: c - cut for k, c in self.counts.items() if c > cut})
+
+    def top(self, n: int):
+        return self.counts.most_common(n)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'capacity': self.capacity, 'counts': dict(self.counts)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'HeavyHitters':
+        return cls(int(data.get('capacity', 1000)), data.get('counts') or {})
+
+
+class LatencyHistogram:
+    """HDR 風格的對數-線性直方圖：可合併，百分位相對誤差約 1/2^sub_bits
+
+    值以微秒為單位分桶，稀疏儲存，因此不論處理多少請求記憶體都只與相異桶數相關。
+    """
+
+    def __init__(self, sub_bits: int = 6, counts: Optional[Dict[int, int]] = None):
+        self.sub_bits = sub_bits
+        self.counts = Counter(counts or {})
+        self.total = sum(self.counts.values())
+        self.sum = 0.0
+        self.max = None
+
+    def _index(self, micros: int) -> int:
+        # [0, 2^(s+1)) 每個微秒一桶；之後每個 2 的冪次區間切成 2^s 桶
+        if micros < (2 << self.sub_bits):
+            return micros
+        exp = micros.bit_length() - self.sub_bits - 1
+        return (exp << self.sub_bits) + (micros >> exp)
+
+    def _lower_bound(self, index: int) -> int:
+        sub = 1 << self.sub_bits
+        if index < 2 * sub:
+            return index
+        exp = (index >> self.sub_bits) - 1
+        mantissa = index - (exp << self.sub_bits)
+        return mantissa << exp
+
+    def add(self, seconds: float, count: int = 1):
+        micros = max(int(round(seconds * 1_000_000)), 0)
+        self.counts[self._index(micros)] += count
+        self.total += count
+        self.sum += seconds * count
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def merge(self, other: 'LatencyHistogram'):
+        if other.sub_bits != self.sub_bits:
+            raise ValueError('直方圖精度不同，無法合併')
+        self.counts.update(other.counts)
+        self.total += other.total
+        self.sum += other.sum
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.total:
+            return None
+        rank = max(int(math.ceil(q / 100.0 * self.total)), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                # 取桶中點，並不超過觀測到的最大值
+                lo = self._lower_bound(index)
+                hi = self._lower_bound(index + 1)
+                value = (lo + hi) / 2 / 1_000_000
+                return min(value, self.max) if self.max is not None else value
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'count': self.total,
+            'mean': round(self.sum / self.total, 6) if self.total else None,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'sub_bits': self.sub_bits, 'counts': {str(k): v for k, v in self.counts.items()},
+                'sum': self.sum, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LatencyHistogram':
+        hist = cls(int(data.get('sub_bits', 6)), {int(k): int(v) for k, v in (data.get('counts') or {}).items()})
+        hist.sum = float(data.get('sum') or 0.0)
+        hist.max = data.get('max')
+        return hist
+
+
+class LatencyAggregate:
+    """延遲百分位：整體、依路由（數量有上限）與依時間桶的可合併直方圖"""
+
+    OTHER = '(other)'
+
+    def __init__(self, field: str = 'request_time', bucket_seconds: int = 3600, max_urls: int = 2000):
+        self.field = field
+        self.bucket_seconds = bucket_seconds
+        self.max_urls = max_urls
+        self.overall = LatencyHistogram()
+        self.by_url: Dict[str, LatencyHistogram] = {}
+        self.by_time: Dict[str, LatencyHistogram] = {}
+
+    def _url_key(self, log: Dict[str, Any]) -> str:
+        # 優先使用解析時產生的路由樣板，否則去除查詢字串
+        key = log.get('route') or (log.get('url') or '-').split('?', 1)[0]
+        if key not in self.by_url and len(self.by_url) >= self.max_urls:
+            return self.OTHER
+        return key
+
+    def add(self, log: Dict[str, Any], ts: Optional[int] = None):
+        """加入單筆記錄；ts 為已解析的 epoch 秒（未提供時自行解析）"""
+        value = log.get(self.field)
+        if value is None:
+            return
+        self.overall.add(value)
+        key = self._url_key(log)
+        hist = self.by_url.get(key)
+        if hist is None:
+            hist = self.by_url[key] = LatencyHistogram()
+        hist.add(value)
+        if ts is None:
+            ts = parse_epoch(log.get('timestamp'))
+        if ts is not None:
+            bucket = str(ts - ts % self.bucket_seconds)
+            hist = self.by_time.get(bucket)
+            if hist is None:
+                hist = self.by_time[bucket] = LatencyHistogram()
+            hist.add(value)
+
+    def add_logs(self, logs: Iterable[Dict[str, Any]]):
+        for log in logs:
+            self.add(log)
+        return self
+
+    def merge(self, other: 'LatencyAggregate') -> 'LatencyAggregate':
+        self.overall.merge(other.overall)
+        for target, source in ((self.by_url, other.by_url), (self.by_time, other.by_time)):
+            for key, hist in source.items():
+                if target is self.by_url and key not in target and len(target) >= self.max_urls:
+                    key = self.OTHER
+                if key in target:
+                    target[key].merge(hist)
+                else:
+                    target[key] = LatencyHistogram.from_dict(hist.to_dict())
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'field': self.field,
+            'bucket_seconds': self.bucket_seconds,
+            'overall': self.overall.to_dict(),
+            'by_url': {k: v.to_dict() for k, v in self.by_url.items()},
+            'by_time': {k: v.to_dict() for k, v in self.by_time.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LatencyAggregate':
+        agg = cls(data.get('field', 'request_time'), int(data.get('bucket_seconds', 3600)))
+        agg.overall = LatencyHistogram.from_dict(data.get('overall') or {})
+        agg.by_url = {k: LatencyHistogram.from_dict(v) for k, v in (data.get('by_url') or {}).items()}
+        agg.by_time = {k: LatencyHistogram.from_dict(v) for k, v in (data.get('by_time') or {}).items()}
+        return agg
+
+    def finalize(self, top_n: int = 20) -> Dict[str, Any]:
+        if not self.overall.total:
+            return {}
+        urls = sorted(self.by_url.items(), key=lambda kv: kv[1].total, reverse=True)[:top_n]
+        return {
+            'field': self.field,
+            'overall': self.overall.summary(),
+            'by_url': [{'url': k, **v.summary()} for k, v in urls],
+            'by_time': [
+                {'time': iso_utc(int(k)), **v.summary()}
+                for k, v in sorted(self.by_time.items(), key=lambda kv: int(kv[0]))
+            ]
+        }
+
+
+class PartialAggregate:
+    """單一節點的可合併部分統計：計數、直方圖、基數估計與時間桶"""
+
+    def __init__(self, bucket_seconds: int = 3600, top_capacity: int = 1000):
+        self.bucket_seconds = bucket_seconds
+        self.total_requests = 0
+        self.total_bytes = 0
+        self.min_ts = None
+        self.max_ts = None
+        self.status_codes = Counter()
+        self.methods = Counter()
+        self.hour_of_day = {}
+        self.time_buckets = {}
+        self.size_histogram = Counter()
+        self.unique_ips = HyperLogLog()
+        self.top_ips = HeavyHitters(top_capacity)
+        self.top_urls = HeavyHitters(top_capacity)
+        self.latency = LatencyAggregate(bucket_seconds=bucket_seconds)
+
+    def add_logs(self, logs: Iterable[Dict[str, Any]]):
+        ip_counts = Counter()
+        url_counts = Counter()
+        for log in logs:
+            size = log.get('response_size') or 0
+            self.total_requests += 1
+            self.total_bytes += size
+            self.status_codes[str(log.get('status_code') or 0)] += 1
+            if log.get('method') is not None:
+                self.methods[str(log['method'])] += 1
+            ip = log.get('ip')
+            if ip is not None:
+                ip_counts[ip] += 1
+            url = log.get('route') or log.get('url')
+            if url is not None:
+                url_counts[url] += 1
+            self.size_histogram[str(int(size).bit_length())] += 1
+
+            ts = parse_epoch(log.get('timestamp'))
+            if log.get('request_time') is not None:
+                self.latency.add(log, ts)
+            if ts is None:
+                continue
+            self.min_ts = ts if self.min_ts is None else min(self.min_ts, ts)
+            self.max_ts = ts if self.max_ts is None else max(self.max_ts, ts)
+            if ip is not None:
+                hour = str((ts // 3600) % 24)
+                slot = self.hour_of_day.setdefault(hour, [0, 0])
+                slot[0] += 1
+                slot[1] += size
+            bucket = str(ts - ts % self.bucket_seconds)
+            slot = self.time_buckets.setdefault(bucket, [0, 0])
+            slot[0] += 1
+            slot[1] += size
+
+        # 每個相異IP只計算一次雜湊
+        for ip in ip_counts:
+            self.unique_ips.add(ip)
+        self.top_ips.update(ip_counts)
+        self.top_urls.update(url_counts)
+        return self
+
+    def merge(self, other: 'PartialAggregate') -> 'PartialAggregate':
+        if other.bucket_seconds != self.bucket_seconds:
+            raise ValueError('時間桶大小不同，無法合併')
+        self.total_requests += other.total_requests
+        self.total_bytes += other.total_bytes
+        for attr in ('min_ts', 'max_ts'):
+            mine, theirs = getattr(self, attr), getattr(other, attr)
+            if theirs is not None:
+                pick = min if attr == 'min_ts' else max
+                setattr(self, attr, theirs if mine is None else pick(mine, theirs))
+        self.status_codes.update(other.status_codes)
+        self.methods.update(other.methods)
+        self.size_histogram.update(other.size_histogram)
+        for target, source in ((self.hour_of_day, other.hour_of_day), (self.time_buckets, other.time_buckets)):
+            for key, (req, nbytes) in source.items():
+                slot = target.setdefault(key, [0, 0])
+                slot[0] += req
+                slot[1] += nbytes
+        self.unique_ips.merge(other.unique_ips)
+        self.top_ips.merge(other.top_ips)
+        self.top_urls.merge(other.top_urls)
+        self.latency.merge(other.latency)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'bucket_seconds': self.bucket_seconds,
+            'total_requests': self.total_requests,
+            'total_bytes': self.total_bytes,
+            'min_ts': self.min_ts,
+            'max_ts': self.max_ts,
+            'status_codes': dict(self.status_codes),
+            'methods': dict(self.methods),
+            'hour_of_day': self.hour_of_day,
+            'time_buckets': self.time_buckets,
+            'size_histogram': dict(self.size_histogram),
+            'unique_ips': self.unique_ips.to_dict(),
+            'top_ips': self.top_ips.to_dict(),
+            'top_urls': self.top_urls.to_dict(),
+            'latency': self.latency.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'PartialAggregate':
+        agg = cls(int(data.get('bucket_seconds', 3600)))
+        agg.total_requests = int(data.get('total_requests', 0))
+        agg.total_bytes = int(data.get('total_bytes', 0))
+        agg.min_ts = data.get('min_ts')
+        agg.max_ts = data.get('max_ts')
+        agg.status_codes = Counter(data.get('status_codes') or {})
+        agg.methods = Counter(data.get('methods') or {})
+        agg.hour_of_day = {k: list(v) for k, v in (data.get('hour_of_day') or {}).items()}
+        agg.time_buckets = {k: list(v) for k, v in (data.get('time_buckets') or {}).items()}
+        agg.size_histogram = Counter(data.get('size_histogram') or {})
+        agg.unique_ips = HyperLogLog.from_dict(data['unique_ips'])
+        agg.top_ips = HeavyHitters.from_dict(data['top_ips'])
+        agg.top_urls = HeavyHitters.from_dict(data['top_urls'])
+        if data.get('latency'):
+            agg.latency = LatencyAggregate.from_dict(data['latency'])
+        return agg
+
+    def finalize(self, top_n: int = 10) -> Dict[str, Any]:
+        """轉為與 get_basic_stats 相容的結果，並附上每小時流量與時間桶"""
+        if not self.total_requests:
+            return {}
+
+        result = {
+            'total_requests': self.total_requests,
+            'unique_ips': self.unique_ips.estimate(),
+            'status_codes': dict(self.status_codes.most_common()),
+            'top_ips': [{'ip': k, 'count': int(c)} for k, c in self.top_ips.top(top_n)],
+            'top_urls': [{'url': k, 'count': int(c)} for k, c in self.top_urls.top(top_n)],
+            'methods': dict(self.methods.most_common()),
+            'time_range': {'start': iso_utc(self.min_ts), 'end': iso_utc(self.max_ts)},
+            'total_bytes': self.total_bytes,
+            'avg_response_size': int(self.total_bytes / self.total_requests),
+            'hourly_traffic': {
+                k: {'requests': v[0], 'bytes': v[1]}
+                for k, v in sorted(self.hour_of_day.items(), key=lambda kv: int(kv[0]))
+            },
+            'time_buckets': [
+                {'time': iso_utc(int(k)), 'requests': v[0], 'bytes': v[1]}
+                for k, v in sorted(self.time_buckets.items(), key=lambda kv: int(kv[0]))
+            ],
+            'response_size_histogram': {
+                f'<{1 << int(k)}': int(v) for k, v in sorted(self.size_histogram.items(), key=lambda kv: int(kv[0]))
+            }
+        }
+        latency = self.latency.finalize()
+        if latency:
+            result['latency'] = latency
+        return result
+
+
+def merge_partials(partials: List[Dict[str, Any]]) -> PartialAggregate:
+    """合併多個節點回傳的部分統計（to_dict 格式）"""
+    merged = None
+    for data in partials:
+        agg = PartialAggregate.from_dict(data)
+        merged = agg if merged is None else merged.merge(agg)
+    return merged or PartialAggregate()
@@ -0,0 +1,337 @@
+import os
+import re
+import math
+import time
+import sqlite3
+from contextlib import closing
+from typing import List, Dict, Any, Optional, Callable
+
+from log_utils import parse_epoch, iso_utc, decode_bytes, tail_settled
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,
+    log_type TEXT,
+    ip TEXT,
+    ts INTEGER,
+    timestamp TEXT,
+    method TEXT,
+    url TEXT,
+    route TEXT,
+    protocol TEXT,
+    status_code INTEGER,
+    response_size INTEGER,
+    referer TEXT,
+    user_agent TEXT,
+    level TEXT,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_logs_ts ON logs(ts);
+CREATE INDEX IF NOT EXISTS idx_logs_file_ts ON logs(file, ts);
+CREATE INDEX IF NOT EXISTS idx_logs_type_ts ON logs(log_type, ts);
+CREATE INDEX IF NOT EXISTS idx_logs_status ON logs(status_code);
+CREATE INDEX IF NOT EXISTS idx_logs_ip ON logs(ip);
+CREATE TABLE IF NOT EXISTS ingest_state (
+    file TEXT PRIMARY KEY,
+    inode INTEGER,
+    size INTEGER,
+    offset INTEGER,
+    mtime REAL
+);
+"""
+
+RECORD_FIELDS = ['log_type', 'ip', 'timestamp', 'method', 'url', 'route', 'protocol', 'status_code',
+                 'response_size', 'referer', 'user_agent', 'level', 'message']
+
+# 唯讀查詢端點允許的 authorizer 動作（其餘一律拒絕，含 ATTACH/PRAGMA/寫入）
+_READONLY_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION}
+_QUERY_PREFIX = re.compile(r'^\s*(select|with)\b', re.IGNORECASE)
+
+
+class QueryError(Exception):
+    """唯讀查詢被拒絕或執行失敗"""
+
+
+class SQLiteBackend:
+    """以 SQLite 為嵌入式查詢後端：增量匯入LOG並以 SQL 執行統計"""
+
+    def __init__(self, db_path: str, parse_line: Callable[[str], Optional[Dict[str, Any]]],
+                 batch_size: int = 5000):
+        self.db_path = db_path
+        self.parse_line = parse_line
+        self.batch_size = batch_size
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            # 舊版資料庫補上 route 欄位（既有資料為 NULL，統計時退回 url）
+            columns = {r['name'] for r in conn.execute('PRAGMA table_info(logs)')}
+            if 'route' not in columns:
+                conn.execute('ALTER TABLE logs ADD COLUMN route TEXT')
+                conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # ---- 匯入 ----
+
+    def ingest(self, file_paths: List[str]) -> int:
+        """增量匯入：只讀取自上次位移之後新增的完整行；檔案被輪替/截斷時重新匯入。"""
+        total = 0
+        for path in file_paths:
+            try:
+                total += self._ingest_file(path)
+            except OSError:
+                continue
+        return total
+
+    def _ingest_file(self, path: str) -> int:
+        st = os.stat(path)
+        name = os.path.basename(path)
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT inode, size, offset, mtime FROM ingest_state WHERE file = ?', (name,)).fetchone()
+            offset = 0
+            settled = tail_settled(st)
+            if row is not None:
+                if row['inode'] == st.st_ino and st.st_size >= row['offset']:
+                    if st.st_size == row['size'] and st.st_mtime == row['mtime'] and row['offset'] >= st.st_size:
+                        conn.rollback()
+                        return 0
+                    offset = row['offset']
+                    settled = tail_settled(st, row['size'], row['mtime'])
+                else:
+                    # 輪替或截斷：清除舊資料重新匯入
+                    conn.execute('DELETE FROM logs WHERE file = ?', (name,))
+
+            inserted = 0
+            batch = []
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                for raw in f:
+                    if offset + len(raw) > st.st_size:
+                        # stat 之後才寫入的內容留待下次匯入
+                        break
+                    if not raw.endswith(b'\n') and not settled:
+                        # 尚未寫完的最後一行留待檔案穩定後再匯入
+                        break
+                    offset += len(raw)
+                    parsed = self.parse_line(decode_bytes(raw))
+                    if not parsed:
+                        continue
+                    batch.append(self._row(name, parsed))
+                    if len(batch) >= self.batch_size:
+                        inserted += self._insert(conn, batch)
+                        batch = []
+            if batch:
+                inserted += self._insert(conn, batch)
+
+            conn.execute(
+                'INSERT OR REPLACE INTO ingest_state (file, inode, size, offset, mtime) VALUES (?, ?, ?, ?, ?)',
+                (name, st.st_ino, st.st_size, offset, st.st_mtime)
+            )
+            conn.commit()
+            return inserted
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row(name: str, parsed: Dict[str, Any]) -> tuple:
+        return (name, parse_epoch(parsed.get('timestamp'))) + tuple(parsed.get(k) for k in RECORD_FIELDS)
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, rows: List[tuple]) -> int:
+        conn.executemany(
+            'INSERT INTO logs (file, ts, ' + ', '.join(RECORD_FIELDS) + ') VALUES (' + ', '.join(['?'] * (len(RECORD_FIELDS) + 2)) + ')',
+            rows
+        )
+        return len(rows)
+
+    # ---- 查詢 ----
+
+    @staticmethod
+    def _where(filename: str = None, start: Optional[int] = None, end: Optional[int] = None,
+               domain: str = None, log_type: str = None, search: str = None):
+        clauses, params = [], []
+        if filename:
+            clauses.append('file = ?')
+            params.append(os.path.basename(filename))
+        if start is not None:
+            clauses.append('ts >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('ts <= ?')
+            params.append(end)
+        if domain:
+            clauses.append("(instr(lower(coalesce(url, '')), ?) > 0 OR instr(lower(coalesce(referer, '')), ?) > 0)")
+            params.extend([domain.lower(), domain.lower()])
+        if log_type:
+            clauses.append('log_type = ?')
+            params.append(log_type)
+        if search:
+            cols = ['ip', 'url', 'method', 'CAST(status_code AS TEXT)', 'user_agent', 'message']
+            clauses.append('(' + ' OR '.join(f"instr(lower(coalesce({c}, '')), ?) > 0" for c in cols) + ')')
+            params.extend([search.lower()] * len(cols))
+        where = (' WHERE ' + ' AND '.join(clauses)) if clauses else ''
+        return where, params
+
+    def basic_stats(self, filename: str = None, start: int = None, end: int = None, domain: str = None) -> Dict[str, Any]:
+        where, params = self._where(filename, start, end, domain)
+        with closing(self._connect()) as conn:
+            head = conn.execute(
+                'SELECT COUNT(*) AS n, COUNT(DISTINCT ip) AS ips, MIN(ts) AS t0, MAX(ts) AS t1, '
+                'SUM(COALESCE(response_size, 0)) AS bytes FROM logs' + where, params
+            ).fetchone()
+            if not head['n']:
+                return {}
+            status = conn.execute(
+                'SELECT COALESCE(status_code, 0) AS k, COUNT(*) AS c FROM logs' + where + ' GROUP BY k ORDER BY c DESC', params
+            ).fetchall()
+            top_ips = self._top(conn, 'ip', where, params, 10)
+            top_urls = self._top(conn, 'COALESCE(route, url)', where, params, 10)
+            methods = self._top(conn, 'method', where, params, None)
+
+        return {
+            'total_requests': int(head['n']),
+            'unique_ips': int(head['ips']),
+            'status_codes': {str(r['k']): int(r['c']) for r in status},
+            'top_ips': [{'ip': str(k), 'count': c} for k, c in top_ips],
+            'top_urls': [{'url': str(k), 'count': c} for k, c in top_urls],
+            'methods': {str(k): c for k, c in methods},
+            'time_range': {
+                'start': iso_utc(head['t0']),
+                'end': iso_utc(head['t1'])
+            },
+            'total_bytes': int(head['bytes'] or 0),
+            'avg_response_size': int((head['bytes'] or 0) / head['n'])
+        }
+
+    @staticmethod
+    def _top(conn, column: str, where: str, params: list, limit: Optional[int]):
+        """依次數遞減；同次數依首次出現位置（檔名順序、檔內行序）排序，與 pandas 路徑一致"""
+        cond = f'{column} IS NOT NULL'
+        where = (where + ' AND ' + cond) if where else (' WHERE ' + cond)
+        # 同一檔案的 id 依行序遞增：先取各檔內的次數與最小 id，再以（檔名, id）最小者為首次出現
+        sql = (f'SELECT k, SUM(c) AS c FROM (SELECT {column} AS k, file, COUNT(*) AS c, MIN(id) AS i '
+               f'FROM logs{where} GROUP BY k, file) '
+               "GROUP BY k ORDER BY c DESC, MIN(file || char(0) || printf('%020d', i))")
+        if limit:
+            sql += f' LIMIT {int(limit)}'
+        return [(r['k'], int(r['c'])) for r in conn.execute(sql, params)]
+
+    def hourly_traffic(self, filename: str = None, start: int = None, end: int = None) -> Dict[str, Any]:
+        where, params = self._where(filename, start, end)
+        cond = 'ts IS NOT NULL'
+        where = (where + ' AND ' + cond) if where else (' WHERE ' + cond)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT CAST(strftime('%H', ts, 'unixepoch') AS INTEGER) AS hour, COUNT(ip) AS requests, "
+                'SUM(COALESCE(response_size, 0)) AS bytes FROM logs' + where + ' GROUP BY hour ORDER BY hour', params
+            ).fetchall()
+        return {str(r['hour']): {'requests': int(r['requests']), 'bytes': int(r['bytes'])} for r in rows}
+
+    def anomalies(self, filename: str = None, start: int = None, end: int = None) -> Dict[str, Any]:
+        where, params = self._where(filename, start, end)
+        with closing(self._connect()) as conn:
+            if not conn.execute('SELECT COUNT(*) FROM logs' + where, params).fetchone()[0]:
+                return {}
+            ip_counts = self._top(conn, 'ip', where, params, None)
+
+            # 高頻率IP：平均 + 2 倍樣本標準差（與 pandas 版本一致）
+            high_freq = {}
+            if ip_counts:
+                values = [c for _, c in ip_counts]
+                mean = sum(values) / len(values)
+                std = math.sqrt(sum((v - mean) ** 2 for v in values) / (len(values) - 1)) if len(values) > 1 else float('nan')
+                threshold = mean + 2 * std
+                high_freq = {k: c for k, c in ip_counts if c > threshold}
+
+            err_where = (where + ' AND ' if where else ' WHERE ') + 'status_code >= 400'
+            errors = conn.execute(
+                'SELECT status_code, COUNT(*) AS c FROM logs' + err_where + ' GROUP BY status_code', params
+            ).fetchall()
+
+            # 大檔案請求：第 95 百分位（線性內插）以上
+            size_where = (where + ' AND ' if where else ' WHERE ') + 'response_size IS NOT NULL'
+            n = conn.execute('SELECT COUNT(*) FROM logs' + size_where, params).fetchone()[0]
+            large = []
+            if n:
+                pos = 0.95 * (n - 1)
+                lo = int(math.floor(pos))
+                pair = [r[0] for r in conn.execute(
+                    'SELECT response_size FROM logs' + size_where + ' ORDER BY response_size LIMIT 2 OFFSET ?',
+                    params + [lo]
+                )]
+                q = pair[0] + (pair[-1] - pair[0]) * (pos - lo)
+                large = [dict(r) for r in conn.execute(
+                    'SELECT ip, url, response_size FROM logs' + size_where + ' AND response_size > ? ORDER BY id',
+                    params + [q]
+                )]
+
+        return {
+            'high_frequency_ips': high_freq,
+            'error_requests': {int(r['status_code']): int(r['c']) for r in errors},
+            'large_requests': large
+        }
+
+    def get_logs(self, filename: str = None, start: int = None, end: int = None, domain: str = None,
+                 search: str = None, page: int = 1, page_size: int = 10, log_type: str = None) -> Dict[str, Any]:
+        where, params = self._where(filename, start, end, domain, log_type if log_type in ('access', 'error') else None, search)
+        with closing(self._connect()) as conn:
+            total = conn.execute('SELECT COUNT(*) FROM logs' + where, params).fetchone()[0]
+            rows = conn.execute(
+                'SELECT ' + ', '.join(RECORD_FIELDS) + ' FROM logs' + where + ' ORDER BY id LIMIT ? OFFSET ?',
+                params + [page_size, max(page - 1, 0) * page_size]
+            ).fetchall()
+        logs = []
+        for r in rows:
+            rec = dict(r)
+            if rec['log_type'] == 'access':
+                rec.pop('level', None)
+                rec.pop('message', None)
+            logs.append(rec)
+        return {
+            'logs': logs,
+            'total': total,
+            'total_pages': (total + page_size - 1) // page_size,
+            'current_page': page
+        }
+
+    def run_readonly_query(self, sql: str, params: Optional[list] = None, max_rows: int = 1000,
+                           timeout: float = 5.0) -> Dict[str, Any]:
+        """執行唯讀 SQL：僅允許單一 SELECT/WITH，連線以唯讀模式開啟並由 authorizer 限制動作。"""
+        sql = (sql or '').strip().rstrip(';').strip()
+        if not _QUERY_PREFIX.match(sql) or ';' in sql:
+            raise QueryError('僅允許單一 SELECT / WITH 查詢')
+
+        conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True, timeout=timeout)
+        try:
+            conn.execute('PRAGMA query_only = ON')
+
+            def authorizer(action, *args):
+                return sqlite3.SQLITE_OK if action in _READONLY_ACTIONS else sqlite3.SQLITE_DENY
+            conn.set_authorizer(authorizer)
+
+            deadline = time.monotonic() + timeout
+            conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, 10000)
+            try:
+                cur = conn.execute(sql, params or [])
+                rows = cur.fetchmany(max_rows + 1)
+            except sqlite3.Error as e:
+                raise QueryError(str(e)) from e
+            columns = [d[0] for d in cur.description or []]
+            return {
+                'columns': columns,
+                'rows': [list(r) for r in rows[:max_rows]],
+                'truncated': len(rows) > max_rows
+            }
+        finally:
+            conn.close()
@@ -0,0 +1,188 @@
+import os
+import re
+import json
+import time
+import shutil
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional, Tuple
+
+from log_utils import write_json_atomic
+
+try:
+    import fcntl
+except ImportError:  # Windows：不支援跨行程鎖，單一行程執行即可
+    fcntl = None
+
+
+_UNITS = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+LATEST = 'LATEST'
+# 發布的版本目錄名稱（見 run_range）
+_VERSION = re.compile(r'^\d{8}T\d{6}Z_*$')
+
+
+def parse_ranges(value: Optional[str]) -> List[Tuple[str, int]]:
+    """解析 REPORT_RANGES（逗號分隔，例如 1h,1d,7d），回傳 [(名稱, 秒數)]"""
+    ranges = []
+    for part in (value or '').split(','):
+        part = part.strip().lower()
+        if not part:
+            continue
+        m = re.fullmatch(r'(\d+)([mhdw])', part)
+        if not m:
+            raise ValueError(f'無法解析的報表區間: {part}（例如 1h、1d、7d）')
+        ranges.append((part, int(m.group(1)) * _UNITS[m.group(2)]))
+    return ranges
+
+
+class ReportScheduler:
+    """定期為設定的時間區間（最近一小時/一天/一週…）預先產生報表
+
+    每次執行寫入 reports/<區間>/.tmp-<版本>/，完成後整個目錄以 rename 發布為 reports/<區間>/<版本>/，
+    再以 os.replace 更新 LATEST 指標；版本目錄發布後不再修改，舊版本只保留 keep 份。
+    多個 worker 同時啟動排程時，以檔案鎖確保同一時間只有一個行程在產生報表。
+    """
+
+    def __init__(self, analyzer, ranges: List[Tuple[str, int]] = None, interval: int = 300,
+                 keep: int = 3, charts: bool = True):
+        self.analyzer = analyzer
+        self.ranges = ranges or parse_ranges('1h,1d,7d')
+        self.interval = interval
+        self.keep = max(keep, 1)
+        self.charts = charts
+        self.root = os.path.join(analyzer.output_dir, 'reports')
+        self.last_run: Dict[str, Any] = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---- 讀取 ----
+
+    def has_range(self, name: str) -> bool:
+        return any(name == n for n, _ in self.ranges)
+
+    def latest_version(self, name: str) -> Optional[str]:
+        """區間最新發布的版本；未設定的區間名稱一律回傳 None（不以使用者輸入組出路徑）"""
+        if not self.has_range(name):
+            return None
+        try:
+            with open(os.path.join(self.root, name, LATEST), 'r', encoding='utf-8') as f:
+                return json.load(f).get('version')
+        except (OSError, ValueError):
+            return None
+
+    def version_dir(self, name: str, version: str) -> str:
+        """版本目錄路徑；區間須為已設定的名稱、版本須符合發布格式，否則 ValueError"""
+        if not self.has_range(name):
+            raise ValueError(f'未知的報表區間: {name}')
+        if not isinstance(version, str) or not _VERSION.match(version):
+            raise ValueError(f'無效的報表版本: {version}')
+        return os.path.join(self.root, name, version)
+
+    def latest(self, name: str = None) -> Optional[Dict[str, Any]]:
+        """讀取指定區間（預設第一個區間）最新發布的報表"""
+        name = name or self.ranges[0][0]
+        version = self.latest_version(name)
+        if not version:
+            return None
+        try:
+            with open(os.path.join(self.version_dir(name, version), 'analysis_results.json'), 'r', encoding='utf-8') as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            return None
+        report['version'] = version
+        return report
+
+    # ---- 產生 ----
+
+    def run_range(self, name: str, seconds: int, now: datetime = None) -> Optional[str]:
+        """產生單一區間的報表並發布，回傳版本名稱（無資料時仍發布空報表）"""
+        now = now or datetime.now(timezone.utc)
+        start_time = (now - timedelta(seconds=seconds)).isoformat()
+        end_time = now.isoformat()
+        base = os.path.join(self.root, name)
+        os.makedirs(base, exist_ok=True)
+
+        version = now.strftime('%Y%m%dT%H%M%SZ')
+        while os.path.exists(os.path.join(base, version)):
+            version += '_'
+        tmp_dir = os.path.join(base, f'.tmp-{version}')
+        os.makedirs(tmp_dir, exist_ok=True)
+        try:
+            logs = self.analyzer.load_logs(None, start_time, end_time)
+            chart_files = []
+            chart_error = None
+            if self.charts and logs:
+                try:
+                    interval = 'hourly' if seconds <= 86400 else 'daily'
+                    chart_files = self.analyzer.generate_charts(logs, interval, output_dir=tmp_dir,
+                                                                traffic_range=(start_time, end_time))
+                except Exception as e:
+                    chart_error = str(e)
+            self.analyzer.export_results(logs, output_dir=tmp_dir, extra={
+                'range': name,
+                'start_time': start_time,
+                'end_time': end_time,
+                'charts': [os.path.basename(c) for c in chart_files],
+                'chart_error': chart_error,
+            })
+            os.replace(tmp_dir, os.path.join(base, version))
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        write_json_atomic(os.path.join(base, LATEST), {'version': version, 'published_at': datetime.now(timezone.utc).isoformat()})
+        self._gc(base, version)
+        return version
+
+    def _gc(self, base: str, current: str):
+        """刪除超出保留數量的舊版本與中斷殘留的暫存目錄（LATEST 指向的版本一律保留）"""
+        versions = sorted(d for d in os.listdir(base) if not d.startswith('.') and d != LATEST
+                          and os.path.isdir(os.path.join(base, d)))
+        for old in versions[:-self.keep]:
+            if old != current:
+                shutil.rmtree(os.path.join(base, old), ignore_errors=True)
+        cutoff = time.time() - 3600
+        for d in os.listdir(base):
+            path = os.path.join(base, d)
+            if d.startswith('.tmp-') and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def run_once(self) -> Dict[str, Any]:
+        """執行所有區間；若其他行程正在產生報表則略過本輪"""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, '.lock'), 'w') as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return {}
+            results = {}
+            for name, seconds in self.ranges:
+                started = time.perf_counter()
+                try:
+                    version = self.run_range(name, seconds)
+                    results[name] = {'ok': True, 'version': version}
+                except Exception as e:
+                    results[name] = {'ok': False, 'error': str(e)}
+                results[name]['seconds'] = round(time.perf_counter() - started, 3)
+            self.last_run = {'at': datetime.now(timezone.utc).isoformat(), 'ranges': results}
+            return results
+
+    # ---- 背景執行緒 ----
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"報表排程失敗: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='report-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,202 @@
+import math
+import zlib
+import heapq
+from collections import Counter
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+from log_utils import iso_utc
+
+
+DEFAULT_BLOCK_SIZE = 256 * 1024
+DEFAULT_RATES = (0.01, 0.05, 0.25, 1.0)
+Z_95 = 1.959964
+# 區塊間變異需有足夠樣本才可信：達到此區塊數（或已處理全部區塊）前不以 target_error 提前停止
+MIN_STOP_BLOCKS = 30
+
+
+def parse_rates(value: Optional[str]) -> Tuple[float, ...]:
+    """解析逐步精化的取樣率（逗號分隔，遞增且介於 0~1，例如 0.01,0.1,1）"""
+    if not value:
+        return DEFAULT_RATES
+    rates = sorted({float(v) for v in str(value).split(',') if v.strip()})
+    # nan 與任何數比較皆為假：逐一檢查才會被排除
+    if not rates or not all(0 < r <= 1 for r in rates):
+        raise ValueError('取樣率必須介於 0 與 1 之間')
+    return tuple(rates)
+
+
+def block_weight(name: str, index: int) -> float:
+    """區塊的確定性雜湊值（0~1）：取樣率 r 時只處理雜湊值小於 r 的區塊，低取樣率的樣本必為高取樣率的子集"""
+    return zlib.crc32(f'{name}:{index}'.encode('utf-8')) / 4294967296.0
+
+
+def block_position(file_index: int, offset: int) -> int:
+    """區塊在全部檔案中的排序位置（檔案順序、位移）；區塊內的行數不超過位元組數，位置不會重疊"""
+    return (file_index << 48) + offset
+
+
+def plan_blocks(files: Iterable[Tuple[str, int]], block_size: int = DEFAULT_BLOCK_SIZE) -> List[Tuple[float, str, int]]:
+    """將 (檔名, 大小) 切成固定大小的區塊，回傳依雜湊值排序的 [(雜湊值, 檔名, 起始位移)]"""
+    blocks = []
+    for name, size in files:
+        for i in range(int(math.ceil(size / block_size))):
+            blocks.append((block_weight(name, i), name, i * block_size))
+    blocks.sort()
+    return blocks
+
+
+class SampledStats:
+    """以區塊為抽樣單位的基本統計估計
+
+    總量以「區塊總數 / 已抽區塊數」放大（Horvitz–Thompson）；同一區塊內的行彼此相關，
+    因此誤差以區塊間變異（群集抽樣、不放回修正）計算 95% 信賴區間，全部區塊處理完時誤差為 0。
+    """
+
+    def __init__(self, blocks_total: int, top_capacity: int = 5000):
+        self.blocks_total = blocks_total
+        self.top_capacity = top_capacity
+        self.blocks: List[Tuple[int, int, Counter]] = []
+        self.ip_counts = Counter()
+        self.url_counts = Counter()
+        self.methods = Counter()
+        self.unique_ips = set()
+        # 熱門項目首次出現的位置：同次數時依原始檔案順序排列，與 get_basic_stats 一致
+        self.ip_first: Dict[Any, int] = {}
+        self.url_first: Dict[Any, int] = {}
+        self.first_ts = None
+        self.last_ts = None
+
+    def add_block(self, records: Iterable[Tuple[Dict[str, Any], Optional[int]]], position: int = 0):
+        """加入一個已抽中區塊內（已過濾）的記錄 (record, epoch)
+
+        position 為區塊在全部檔案中的排序位置（見 block_position），區塊內每筆記錄依序遞增。
+        """
+        requests = size = 0
+        status = Counter()
+        ip_first, url_first = self.ip_first, self.url_first
+        for log, ts in records:
+            pos = position + requests
+            requests += 1
+            size += log.get('response_size') or 0
+            status[str(log.get('status_code') or 0)] += 1
+            if log.get('method') is not None:
+                self.methods[str(log['method'])] += 1
+            ip = log.get('ip')
+            if ip is not None:
+                self.ip_counts[ip] += 1
+                self.unique_ips.add(ip)
+                if ip_first.get(ip, pos + 1) > pos:
+                    ip_first[ip] = pos
+            url = log.get('route') or log.get('url')
+            if url is not None:
+                self.url_counts[url] += 1
+                if url_first.get(url, pos + 1) > pos:
+                    url_first[url] = pos
+            if ts is not None:
+                if self.first_ts is None or ts < self.first_ts:
+                    self.first_ts = ts
+                if self.last_ts is None or ts > self.last_ts:
+                    self.last_ts = ts
+        self.blocks.append((requests, size, status))
+        # 熱門項目只保留前段，避免高基數欄位讓記憶體隨樣本成長
+        for counter, first in ((self.ip_counts, ip_first), (self.url_counts, url_first)):
+            if len(counter) > self.top_capacity * 2:
+                kept = self._top(counter, first, self.top_capacity)
+                counter.clear()
+                counter.update(dict(kept))
+                for key in [k for k in first if k not in counter]:
+                    del first[key]
+
+    @staticmethod
+    def _top(counter: Counter, first: Dict[Any, int], n: int) -> List[Tuple[Any, int]]:
+        """依次數遞減、同次數依首次出現位置排序的前 n 項"""
+        return heapq.nsmallest(n, counter.items(), key=lambda kv: (-kv[1], first.get(kv[0], 0)))
+
+    @property
+    def scale(self) -> float:
+        return self.blocks_total / len(self.blocks) if self.blocks else 0.0
+
+    def _total(self, values: List[float]) -> Dict[str, Any]:
+        n, N = len(values), self.blocks_total
+        estimate = sum(values) * self.scale
+        if n >= N:
+            stderr = 0.0
+        elif n < 2:
+            stderr = None
+        else:
+            mean = sum(values) / n
+            var = sum((v - mean) ** 2 for v in values) / (n - 1)
+            stderr = N * math.sqrt((1 - n / N) * var / n)
+        return self._interval(estimate, stderr)
+
+    def _ratio(self, num: List[float], den: List[float]) -> Dict[str, Any]:
+        n, N = len(num), self.blocks_total
+        total_den = sum(den)
+        if not total_den:
+            return self._interval(0.0, None)
+        r = sum(num) / total_den
+        if n >= N:
+            stderr = 0.0
+        elif n < 2:
+            stderr = None
+        else:
+            # 線性化：殘差 d_i = y_i - r * x_i
+            d = [a - r * b for a, b in zip(num, den)]
+            mean_den = total_den / n
+            var = sum(v * v for v in d) / (n - 1)
+            stderr = math.sqrt((1 - n / N) * var / n) / mean_den
+        return self._interval(r, stderr)
+
+    @staticmethod
+    def _interval(estimate: float, stderr: Optional[float]) -> Dict[str, Any]:
+        if stderr is None:
+            return {'estimate': estimate, 'stderr': None, 'low': None, 'high': None}
+        return {'estimate': estimate, 'stderr': stderr,
+                'low': max(estimate - Z_95 * stderr, 0.0), 'high': estimate + Z_95 * stderr}
+
+    def estimate(self, top_n: int = 10) -> Dict[str, Any]:
+        """回傳與 get_basic_stats 相同鍵值的估計結果，另附 sampling 與 error_bars"""
+        requests = [b[0] for b in self.blocks]
+        sizes = [b[1] for b in self.blocks]
+        total = self._total(requests)
+        total_bytes = self._total(sizes)
+        avg_size = self._ratio(sizes, requests)
+        codes = set()
+        for b in self.blocks:
+            codes.update(b[2])
+        status = {code: self._total([b[2].get(code, 0) for b in self.blocks]) for code in sorted(codes)}
+        scale = self.scale
+        exact = len(self.blocks) >= self.blocks_total
+
+        def rounded(iv):
+            return {k: (None if v is None else round(v, 2)) for k, v in iv.items()}
+
+        return {
+            'total_requests': int(round(total['estimate'])),
+            'unique_ips': len(self.unique_ips),
+            'status_codes': {k: int(round(v['estimate'])) for k, v in
+                             sorted(status.items(), key=lambda kv: kv[1]['estimate'], reverse=True)},
+            'top_ips': [{'ip': str(k), 'count': int(round(c * scale))}
+                        for k, c in self._top(self.ip_counts, self.ip_first, top_n)],
+            'top_urls': [{'url': str(k), 'count': int(round(c * scale))}
+                         for k, c in self._top(self.url_counts, self.url_first, top_n)],
+            'methods': {str(k): int(round(c * scale)) for k, c in self.methods.most_common()},
+            'time_range': {'start': iso_utc(self.first_ts), 'end': iso_utc(self.last_ts)},
+            'total_bytes': int(round(total_bytes['estimate'])),
+            'avg_response_size': int(avg_size['estimate']),
+            'sampling': {
+                'sample_rate': round(len(self.blocks) / self.blocks_total, 6) if self.blocks_total else 1.0,
+                'blocks_sampled': len(self.blocks),
+                'blocks_total': self.blocks_total,
+                'exact': exact,
+                'confidence': 0.95,
+                # 相異 IP 無法由樣本放大，未處理完全部區塊時為樣本內的下限
+                'unique_ips_is_lower_bound': not exact,
+            },
+            'error_bars': {
+                'total_requests': rounded(total),
+                'total_bytes': rounded(total_bytes),
+                'avg_response_size': rounded(avg_size),
+                'status_codes': {k: rounded(v) for k, v in status.items()},
+            },
+        }
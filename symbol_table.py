@@ -0,0 +1,25 @@
+from typing import Dict, Optional
+
+
+class SymbolTable:
+    """有界的字串符號表：重複出現的值共用同一個 str 物件
+
+    超過 max_size 後新值不再收錄（原樣回傳），避免高基數欄位讓記憶體無限成長。
+    """
+
+    def __init__(self, max_size: int = 65536):
+        self.max_size = max_size
+        self._values: Dict[str, str] = {}
+
+    def intern(self, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return None
+        shared = self._values.get(value)
+        if shared is not None:
+            return shared
+        if len(self._values) < self.max_size:
+            self._values[value] = value
+        return value
+
+    def __len__(self) -> int:
+        return len(self._values)
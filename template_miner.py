@@ -0,0 +1,164 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable
+
+from log_utils import parse_epoch, iso_utc
+
+
+PARAM = '<*>'
+_HAS_DIGIT = re.compile(r'\d')
+
+
+def _tokenize(message: str) -> List[str]:
+    """以空白切詞；含數字的詞（IP、埠號、pid、錯誤碼…）直接視為參數"""
+    return [PARAM if _HAS_DIGIT.search(t) else t for t in (message or '').split()]
+
+
+class _Cluster:
+    __slots__ = ('id', 'tokens', 'leaf')
+
+    def __init__(self, cluster_id: int, tokens: List[str], leaf: list):
+        self.id = cluster_id
+        self.tokens = tokens
+        self.leaf = leaf
+
+    @property
+    def template(self) -> str:
+        return ' '.join(self.tokens)
+
+
+class TemplateMiner:
+    """Drain 風格的線上訊息樣板探勘
+
+    前置樹依「詞數 -> 前 depth-2 個詞」分流到葉節點，葉節點內以逐位相同詞比例挑選最相近的樣板；
+    相似度達 sim_threshold 即合併（不同位置改為 <*>），否則建立新樣板。
+    樣板數上限為 max_clusters，超過時淘汰最久未命中的樣板（並以其 id 呼叫 on_evict），記憶體不隨行數成長。
+    """
+
+    def __init__(self, depth: int = 4, sim_threshold: float = 0.4, max_children: int = 100,
+                 max_clusters: int = 1000, on_evict: Callable[[int], None] = None):
+        self.depth = max(depth, 3)
+        self.sim_threshold = sim_threshold
+        self.max_children = max_children
+        self.max_clusters = max_clusters
+        self._root: Dict[int, dict] = {}
+        self._clusters: 'OrderedDict[int, _Cluster]' = OrderedDict()
+        self._next_id = 1
+        self.evicted = 0
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+
+    def _leaf(self, tokens: List[str]) -> list:
+        node = self._root.get(len(tokens))
+        if node is None:
+            node = self._root[len(tokens)] = {'children': {}, 'clusters': []}
+        for token in tokens[:self.depth - 2]:
+            children = node['children']
+            child = children.get(token)
+            if child is None:
+                if len(children) >= self.max_children:
+                    token = PARAM
+                child = children.get(token)
+                if child is None:
+                    child = children[token] = {'children': {}, 'clusters': []}
+            node = child
+        return node['clusters']
+
+    @staticmethod
+    def _similarity(template: List[str], tokens: List[str]):
+        if not tokens:
+            return 1.0, 0
+        same = params = 0
+        for a, b in zip(template, tokens):
+            if a == PARAM:
+                params += 1
+            elif a == b:
+                same += 1
+        return same / len(tokens), params
+
+    def add(self, message: Optional[str]) -> int:
+        """將訊息歸入樣板並回傳樣板 id"""
+        tokens = _tokenize(message)
+        with self._lock:
+            leaf = self._leaf(tokens)
+            best, best_key = None, None
+            for cluster in leaf:
+                key = self._similarity(cluster.tokens, tokens)
+                if best_key is None or key > best_key:
+                    best, best_key = cluster, key
+            if best is not None and best_key[0] >= self.sim_threshold:
+                best.tokens = [a if a == b else PARAM for a, b in zip(best.tokens, tokens)]
+                self._clusters.move_to_end(best.id)
+                return best.id
+
+            cluster = _Cluster(self._next_id, tokens, leaf)
+            self._next_id += 1
+            leaf.append(cluster)
+            self._clusters[cluster.id] = cluster
+            if len(self._clusters) > self.max_clusters:
+                _, old = self._clusters.popitem(last=False)
+                old.leaf.remove(old)
+                self.evicted += 1
+                if self.on_evict is not None:
+                    self.on_evict(old.id)
+            return cluster.id
+
+    def template(self, template_id: int) -> Optional[str]:
+        cluster = self._clusters.get(template_id)
+        return cluster.template if cluster else None
+
+    def __len__(self) -> int:
+        return len(self._clusters)
+
+
+class TemplateStats:
+    """彙總時探勘樣板，並依樣板 id 累計次數、最早/最晚出現時間與少量範例記錄（每個樣板固定大小）
+
+    每次彙總使用新的 TemplateMiner，結果只取決於輸入記錄；樣板被淘汰時其統計一併移除。
+    """
+
+    def __init__(self, max_examples: int = 3, max_clusters: int = 1000):
+        self.max_examples = max_examples
+        self.total = 0
+        self._stats: Dict[int, Dict[str, Any]] = {}
+        self.miner = TemplateMiner(max_clusters=max_clusters, on_evict=self._evict)
+
+    def _evict(self, template_id: int):
+        self._stats.pop(template_id, None)
+
+    def add(self, record: Dict[str, Any], ts: Optional[int] = None):
+        template_id = self.miner.add(record.get('message'))
+        if ts is None:
+            ts = parse_epoch(record.get('timestamp'))
+        self.total += 1
+        entry = self._stats.get(template_id)
+        if entry is None:
+            entry = self._stats[template_id] = {'count': 0, 'first_seen': ts, 'last_seen': ts, 'examples': []}
+        entry['count'] += 1
+        if ts is not None:
+            if entry['first_seen'] is None or ts < entry['first_seen']:
+                entry['first_seen'] = ts
+            if entry['last_seen'] is None or ts > entry['last_seen']:
+                entry['last_seen'] = ts
+        if len(entry['examples']) < self.max_examples:
+            entry['examples'].append(dict(record, template_id=template_id))
+
+    def finalize(self, top_n: int = 50) -> Dict[str, Any]:
+        ranked = sorted(self._stats.items(), key=lambda kv: kv[1]['count'], reverse=True)
+        templates = []
+        for template_id, entry in ranked[:top_n]:
+            templates.append({
+                'template_id': template_id,
+                'template': self.miner.template(template_id),
+                'count': entry['count'],
+                'first_seen': iso_utc(entry['first_seen']),
+                'last_seen': iso_utc(entry['last_seen']),
+                'examples': entry['examples'],
+            })
+        return {
+            'total_errors': self.total,
+            'template_count': len(self._stats),
+            'evicted_templates': self.miner.evicted,
+            'templates': templates,
+        }
@@ -0,0 +1,35 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BASE = datetime(2025, 9, 24, 0, 0, 0, tzinfo=timezone.utc)
+URLS = ['/', '/index.php', '/api/users/1', '/api/users/2', '/static/app.js', '/wp-login.php']
+
+
+def _access_line(i: int) -> str:
+    # access 時間為 +0800，與 UTC 查詢條件比較時需換算
+    t = (BASE + timedelta(seconds=37 * i)).astimezone(timezone(timedelta(hours=8)))
+    return (f'10.0.0.{i % 7} - - [{t.strftime("%d/%b/%Y:%H:%M:%S %z")}] '
+            f'"GET {URLS[i % len(URLS)]} HTTP/1.1" {(200, 404, 500)[i % 3]} {100 + i} "-" "test-agent"')
+
+
+def _error_line(i: int) -> str:
+    # nginx error 時間沒有時區，視為 UTC
+    t = BASE + timedelta(seconds=53 * i + 11)
+    return (f'{t.strftime("%Y/%m/%d %H:%M:%S")} [error] 123#0: *{i} open() "/var/www/f{i % 4}.txt" failed '
+            f'(2: No such file or directory), client: 10.0.0.{i % 5}, server: example.com, '
+            f'request: "GET /f{i % 4}.txt HTTP/1.1", host: "example.com"')
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    """access 與 nginx error 混合的LOG目錄（access 最後一行沒有換行）"""
+    logs = tmp_path / 'logs'
+    logs.mkdir()
+    (logs / 'access.log').write_text('\n'.join(_access_line(i) for i in range(600)), encoding='utf-8')
+    (logs / 'site.error.log').write_text(''.join(_error_line(i) + '\n' for i in range(300)), encoding='utf-8')
+    return str(logs)
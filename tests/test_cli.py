@@ -0,0 +1,54 @@
+import json
+
+import cli
+
+
+def _run(capsys, *argv):
+    code = cli.main(list(argv) + ['-q'])
+    return code, json.loads(capsys.readouterr().out)
+
+
+def test_no_matching_records_still_writes_summary(log_dir, tmp_path, capsys):
+    out = tmp_path / 'out'
+    code, summary = _run(capsys, f'{log_dir}/access.log', '--domain', 'nomatch.example', '--jobs', '1',
+                         '--output-dir', str(out))
+    assert code == 0
+    assert summary['records'] == 0 and summary['total_requests'] == 0
+    assert json.loads((out / 'analysis_results.json').read_text(encoding='utf-8'))['basic_stats'] == {}
+
+
+def test_missing_input_still_writes_summary(tmp_path, capsys):
+    code, summary = _run(capsys, str(tmp_path / 'nonexistent.log'), '--output-dir', str(tmp_path / 'out'))
+    assert code == 0
+    assert summary['files'] == 0 and summary['total_requests'] == 0
+
+
+def test_unwritable_output_dir_reports_json_error(log_dir, tmp_path, capsys):
+    blocker = tmp_path / 'file'
+    blocker.write_text('x', encoding='utf-8')
+    code, summary = _run(capsys, f'{log_dir}/access.log', '--jobs', '1', '--output-dir', str(blocker / 'out'))
+    assert code == 1
+    assert summary['status'] == 'error' and summary['error']
+
+
+def test_checkpoint_replaces_partial_of_changed_file(log_dir, tmp_path, capsys):
+    ck = tmp_path / 'ck'
+    args = [f'{log_dir}/access.log', '--jobs', '1', '--outputs', 'none', '--checkpoint', str(ck),
+            '--output-dir', str(tmp_path / 'out')]
+    _run(capsys, *args)
+    with open(f'{log_dir}/access.log', 'a', encoding='utf-8') as f:
+        f.write('\n')
+    code, summary = _run(capsys, *args)
+    assert code == 0 and summary['processed'] == 1
+    assert len(list((ck / 'partials').iterdir())) == 1
+
+
+def test_checkpoint_rejects_edited_route_rules(log_dir, tmp_path, capsys):
+    rules = tmp_path / 'rules.json'
+    rules.write_text('[{"pattern": "^/api/users/", "route": "/api/users/:id"}]', encoding='utf-8')
+    args = [f'{log_dir}/access.log', '--jobs', '1', '--outputs', 'none', '--route-rules', str(rules),
+            '--checkpoint', str(tmp_path / 'ck'), '--output-dir', str(tmp_path / 'out')]
+    assert _run(capsys, *args)[0] == 0
+    rules.write_text('[]', encoding='utf-8')
+    code, summary = _run(capsys, *args)
+    assert code == 2 and summary['status'] == 'error'
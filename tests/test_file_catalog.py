@@ -0,0 +1,48 @@
+import os
+
+from conftest import _access_line
+from file_catalog import FileCatalog
+
+
+def _catalog(log_dir, tmp_path):
+    return FileCatalog(log_dir, str(tmp_path / 'catalog.json'), ('.log',), lambda line: 'combined')
+
+
+def _write(path, lines, mtime):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(''.join(line + '\n' for line in lines))
+    os.utime(path, (mtime, mtime))
+
+
+def test_truncated_and_regrown_in_place_is_rescanned(tmp_path):
+    log_dir = tmp_path / 'logs'
+    log_dir.mkdir()
+    path = str(log_dir / 'access.log')
+    _write(path, [_access_line(i) for i in range(100)], 1_000_000)
+    catalog = _catalog(str(log_dir), tmp_path)
+    before = catalog.refresh()['access.log']
+    assert before['line_count'] == 100
+
+    # 同一個 inode 截斷後寫入更多的新內容：大小超過上次位移，但檔頭已不同
+    inode = os.stat(path).st_ino
+    _write(path, [_access_line(i) for i in range(1000, 1150)], 1_000_100)
+    assert os.stat(path).st_ino == inode
+    after = catalog.refresh()['access.log']
+    assert after['line_count'] == 150
+    assert after['first_epoch'] > before['last_epoch']
+
+
+def test_appended_file_scans_only_new_lines(tmp_path):
+    log_dir = tmp_path / 'logs'
+    log_dir.mkdir()
+    path = str(log_dir / 'access.log')
+    _write(path, [_access_line(i) for i in range(100)], 1_000_000)
+    catalog = _catalog(str(log_dir), tmp_path)
+    first = catalog.refresh()['access.log']
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(''.join(_access_line(i) + '\n' for i in range(100, 120)))
+    os.utime(path, (1_000_100, 1_000_100))
+    after = catalog.refresh()['access.log']
+    assert after['line_count'] == 120
+    assert after['first_epoch'] == first['first_epoch']
+    assert after['head'] == first['head']
@@ -0,0 +1,37 @@
+import pytest
+
+from log_analyzer import LogAnalyzer
+
+pytest.importorskip('pyarrow')
+
+WINDOWS = [
+    ('2025-09-24T01:00:00+00:00', '2025-09-24T03:30:00+00:00'),
+    ('2025-09-24T09:00:00+08:00', '2025-09-24T11:30:00+08:00'),
+    ('2025-09-24T01:00:00', '2025-09-24T03:30:00'),
+    (None, '2025-09-24T02:00:00Z'),
+]
+
+
+def _keys(records):
+    return sorted((r.get('log_type'), r.get('timestamp'), r.get('ip'), r.get('url')) for r in records)
+
+
+@pytest.mark.parametrize('start_time,end_time', WINDOWS)
+def test_dataset_and_logs_apply_time_filter_alike(log_dir, tmp_path, start_time, end_time):
+    analyzer = LogAnalyzer(log_dir, str(tmp_path / 'out'))
+    analyzer.export_dataset(analyzer.load_logs(with_source=True), 'parquet')
+
+    from_logs = analyzer.load_logs(None, start_time, end_time)
+    from_dataset = analyzer.load_dataset(start_time, end_time)
+
+    assert {r['log_type'] for r in from_logs} == {'access', 'error'}
+    assert _keys(from_dataset) == _keys(from_logs)
+
+
+def test_reexport_replaces_source_parts(log_dir, tmp_path):
+    analyzer = LogAnalyzer(log_dir, str(tmp_path / 'out'))
+    complete = analyzer.load_logs(with_source=True)
+    for _ in range(2):
+        analyzer.export_dataset(complete, 'parquet')
+    assert len(analyzer.load_dataset()) == len(complete)
+    assert len(analyzer.load_dataset(filename='site.error.log')) == 300
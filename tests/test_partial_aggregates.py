@@ -0,0 +1,57 @@
+import random
+from collections import Counter
+
+from partial_aggregates import HeavyHitters
+
+
+def _stream(seed, n=5000):
+    rng = random.Random(seed)
+    # 少數熱門值加上大量只出現一次的值
+    return [f'hot{rng.randrange(3)}' if rng.random() < 0.4 else f'cold{seed}-{i}' for i in range(n)]
+
+
+def _check(hh, exact, total):
+    bound = total / (hh.capacity + 1)
+    assert len(hh.counts) <= hh.capacity
+    for key, count in hh.counts.items():
+        assert exact[key] - bound <= count <= exact[key]
+    for key, count in exact.items():
+        if count > bound:
+            assert key in hh.counts
+
+
+def test_update_keeps_misra_gries_bounds():
+    items = _stream(1)
+    hh = HeavyHitters(capacity=20)
+    for i in range(0, len(items), 250):
+        hh.update(Counter(items[i:i + 250]))
+    _check(hh, Counter(items), len(items))
+    assert [k for k, _ in hh.top(3)] == [k for k, _ in Counter(items).most_common(3)]
+
+
+def test_merge_keeps_misra_gries_bounds():
+    parts = [_stream(seed) for seed in range(4)]
+    merged = HeavyHitters(capacity=20)
+    for items in parts:
+        hh = HeavyHitters(capacity=20)
+        hh.update(Counter(items))
+        merged.merge(HeavyHitters.from_dict(hh.to_dict()))
+    exact = Counter(x for items in parts for x in items)
+    _check(merged, exact, sum(len(items) for items in parts))
+
+
+def test_exact_when_within_capacity():
+    hh = HeavyHitters(capacity=10)
+    hh.update({'a': 3, 'b': 1})
+    hh.merge(HeavyHitters(10, {'b': 2, 'c': 5}))
+    assert dict(hh.counts) == {'a': 3, 'b': 3, 'c': 5}
+
+
+def test_late_frequent_item_is_kept():
+    # c 在最後才出現但次數超過 N/(capacity+1)：單純截斷前 k 名會一直把它丟掉
+    items = ['a'] * 50 + ['b'] * 50 + ['c'] * 51
+    hh = HeavyHitters(capacity=2)
+    for item in items:
+        hh.update({item: 1})
+    _check(hh, Counter(items), len(items))
+    assert 'c' in hh.counts
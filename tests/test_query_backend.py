@@ -0,0 +1,42 @@
+import os
+import time
+
+import pytest
+
+from log_analyzer import LogAnalyzer
+
+CASES = [
+    {},
+    {'filename': 'access.log'},
+    {'filename': 'site.error.log'},
+    {'start_time': '2025-09-24T01:00:00+00:00', 'end_time': '2025-09-24T04:00:00+00:00'},
+    {'start_time': '2025-09-24T09:00:00+08:00'},
+]
+
+
+@pytest.fixture
+def analyzers(log_dir, tmp_path):
+    # 檔尾未以換行結束：先讓檔案「穩定」，增量匯入才會納入最後一行（與完整讀取一致）
+    past = time.time() - 60
+    for name in os.listdir(log_dir):
+        os.utime(os.path.join(log_dir, name), (past, past))
+    return (LogAnalyzer(log_dir, str(tmp_path / 'pandas')),
+            LogAnalyzer(log_dir, str(tmp_path / 'sqlite'), query_backend='sqlite'))
+
+
+@pytest.mark.parametrize('kwargs', CASES)
+def test_basic_stats_match_pandas(analyzers, kwargs):
+    exact, backend = analyzers
+    expected = exact.get_basic_stats(**kwargs)
+    actual = backend.get_basic_stats(**kwargs)
+    assert expected['total_requests'] > 0
+    # 清單順序（含同次數項目）也須一致
+    assert actual == expected
+    assert list(actual['top_ips']) == list(expected['top_ips'])
+    assert list(actual['top_urls']) == list(expected['top_urls'])
+
+
+@pytest.mark.parametrize('kwargs', CASES)
+def test_hourly_traffic_matches_pandas(analyzers, kwargs):
+    exact, backend = analyzers
+    assert backend.get_hourly_traffic(**kwargs) == exact.get_hourly_traffic(**kwargs)
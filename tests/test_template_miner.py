@@ -0,0 +1,25 @@
+from log_analyzer import LogAnalyzer
+from template_miner import TemplateStats
+
+
+def test_templates_do_not_depend_on_rereads(log_dir, tmp_path):
+    analyzer = LogAnalyzer(log_dir, str(tmp_path / 'out'))
+    first = analyzer.get_error_templates()
+    # 其他查詢重新解析同一批檔案不應影響樣板次數
+    analyzer.load_logs()
+    analyzer.get_basic_stats()
+    assert analyzer.get_error_templates() == first
+    assert first['total_errors'] == 300
+    assert sum(t['count'] for t in first['templates']) == 300
+
+
+def test_evicted_templates_drop_their_stats():
+    stats = TemplateStats(max_clusters=3)
+    for i in range(10):
+        # 詞數不同，各自成為新樣板
+        stats.add({'message': ' '.join(['word'] * (i + 1)), 'timestamp': None})
+    result = stats.finalize()
+    assert result['total_errors'] == 10
+    assert result['template_count'] == 3
+    assert result['evicted_templates'] == 7
+    assert all(t['template'] for t in result['templates'])
@@ -0,0 +1,343 @@
+import os
+import re
+import mmap
+import sqlite3
+import zlib
+from contextlib import closing
+from typing import List, Dict, Any, Optional, Callable, Iterable, Tuple
+
+from log_utils import record_epoch, iso_utc, tail_settled, complete_end
+
+
+# 各層級（名稱, 秒數）與預設保留期間（以最新資料時間起算；0 為永久保留）
+LEVELS = (('1s', 1), ('1m', 60), ('1h', 3600), ('1d', 86400))
+DEFAULT_RETENTION = {'1s': 2 * 86400, '1m': 30 * 86400, '1h': 730 * 86400, '1d': 0}
+STATUS_CLASSES = ('2xx', '3xx', '4xx', '5xx', 'other')
+# 未指定級距時的候選步長（超過一天則以整天為單位）
+NICE_STEPS = (1, 2, 5, 10, 15, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200, 10800, 21600, 43200, 86400)
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+_HEAD_BYTES = 256
+# 每累積這麼多個「秒」就寫入一次，首次匯入大檔時記憶體仍有上限
+_FLUSH_SECONDS = 100000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_state (
+    dev INTEGER,
+    inode INTEGER,
+    file TEXT,
+    head INTEGER,
+    head_len INTEGER,
+    size INTEGER,
+    offset INTEGER,
+    mtime REAL,
+    PRIMARY KEY (dev, inode)
+);
+CREATE TABLE IF NOT EXISTS level_state (
+    level TEXT PRIMARY KEY,
+    pruned_before INTEGER
+);
+""" + ''.join(f"""
+CREATE TABLE IF NOT EXISTS ts_{name} (
+    bucket INTEGER PRIMARY KEY,
+    requests INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    s2xx INTEGER NOT NULL DEFAULT 0,
+    s3xx INTEGER NOT NULL DEFAULT 0,
+    s4xx INTEGER NOT NULL DEFAULT 0,
+    s5xx INTEGER NOT NULL DEFAULT 0,
+    other INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+""" for name, _ in LEVELS)
+
+_COLUMNS = ('requests', 'bytes', 's2xx', 's3xx', 's4xx', 's5xx', 'other')
+
+
+def parse_retention(value: Optional[str]) -> Dict[str, int]:
+    """解析 TIMESERIES_RETENTION（例如 1s=2d,1m=30d,1h=730d,1d=0；單位 s/m/h/d/w，0 為永久保留）"""
+    retention = dict(DEFAULT_RETENTION)
+    for part in (value or '').split(','):
+        part = part.strip().lower()
+        if not part:
+            continue
+        level, _, amount = part.partition('=')
+        level = level.strip()
+        if level not in retention:
+            raise ValueError(f'未知的時序層級: {level}（可用: {", ".join(n for n, _ in LEVELS)}）')
+        amount = amount.strip()
+        if amount == '0':
+            retention[level] = 0
+            continue
+        m = re.fullmatch(r'(\d+)([smhdw])', amount)
+        if not m:
+            raise ValueError(f'無法解析的保留期間: {amount}（例如 2d、30d、0）')
+        retention[level] = int(m.group(1)) * _UNITS[m.group(2)]
+    return retention
+
+
+def _status_index(code) -> int:
+    """狀態碼 -> 欄位索引（2xx..5xx 對應 2..5，其餘為 other）"""
+    try:
+        klass = int(code) // 100
+    except (TypeError, ValueError):
+        return 6
+    return klass if 2 <= klass <= 5 else 6
+
+
+def parse_step(value) -> Optional[int]:
+    """解析級距：秒數或加單位（例如 300、5m、1h、1d）；空值回傳 None（自動選擇）"""
+    if value in (None, ''):
+        return None
+    value = str(value).strip().lower()
+    m = re.fullmatch(r'(\d+)([smhdw]?)', value)
+    if not m or int(m.group(1)) <= 0:
+        raise ValueError(f'無法解析的級距: {value}（例如 60、5m、1h、1d）')
+    return int(m.group(1)) * _UNITS.get(m.group(2) or 's')
+
+
+def _add_record(seconds: Dict[int, List[int]], rec: Dict[str, Any]) -> bool:
+    """將一筆記錄累加到每秒 [請求數, 位元組, 2xx, 3xx, 4xx, 5xx, other]"""
+    ts = record_epoch(rec.get('timestamp'))
+    # 與圖表/每小時流量一致：請求數以有來源 IP 的記錄計算
+    if ts is None or rec.get('ip') is None:
+        return False
+    slot = seconds.get(ts)
+    if slot is None:
+        slot = seconds[ts] = [0, 0, 0, 0, 0, 0, 0]
+    slot[0] += 1
+    slot[1] += rec.get('response_size') or 0
+    slot[_status_index(rec.get('status_code'))] += 1
+    return True
+
+
+def _point(t: int, values) -> Dict[str, Any]:
+    return {
+        'time': iso_utc(t),
+        'epoch': t,
+        'requests': values[0],
+        'bytes': values[1],
+        'status': dict(zip(STATUS_CLASSES, values[2:])),
+    }
+
+
+def nice_step(span: int, max_points: int) -> int:
+    """讓資料點數不超過 max_points 的最小步長"""
+    target = max(span / max(max_points, 1), 1)
+    for step in NICE_STEPS:
+        if step >= target:
+            return step
+    return 86400 * -(-int(target) // 86400)
+
+
+def series_from_records(records: Iterable[Dict[str, Any]], start: int = None, end: int = None,
+                        step: int = None, max_points: int = 2000) -> Dict[str, Any]:
+    """未啟用時序或指定檔名/網域條件時，直接由記錄計算與 TimeSeriesStore.series 相同格式的資料點"""
+    seconds: Dict[int, List[int]] = {}
+    for rec in records:
+        _add_record(seconds, rec)
+    if not seconds:
+        return {'level': 'raw', 'step': step, 'start': None, 'end': None, 'points': []}
+    start = min(seconds) if start is None else start
+    end = max(seconds) if end is None else end
+    step = step or nice_step(end - start + 1, max_points)
+    buckets: Dict[int, List[int]] = {}
+    for ts, values in seconds.items():
+        if start <= ts <= end:
+            slot = buckets.setdefault(ts - ts % step, [0] * len(values))
+            for i, v in enumerate(values):
+                slot[i] += v
+    return {'level': 'raw', 'step': step, 'start': iso_utc(start), 'end': iso_utc(end),
+            'points': [_point(t, buckets[t]) for t in sorted(buckets)]}
+
+
+class TimeSeriesStore:
+    """多層級（1 秒 / 1 分 / 1 小時 / 1 天）流量時序：請求數、位元組與狀態碼類別
+
+    匯入時只掃描各檔上次位移之後新增的完整行（以 inode 追蹤，輪替改名的檔案不會重複計算），
+    先彙總到秒再累加到各層級；各層級依保留期間刪除舊資料點。查詢依區間與步長挑選
+    能涵蓋區間且讀取點數最少的層級，一年的趨勢只需讀取數百到數千個資料點。
+    """
+
+    def __init__(self, db_path: str, scan_range: Callable, retention: Dict[str, int] = None):
+        self.db_path = db_path
+        self.scan_range = scan_range
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # ---- 匯入 ----
+
+    def ingest(self, file_paths: List[str]) -> int:
+        """增量匯入多個檔案，回傳新增計入的記錄數"""
+        total = 0
+        for path in file_paths:
+            try:
+                total += self._ingest_file(path)
+            except OSError:
+                continue
+        return total
+
+    def _ingest_file(self, path: str) -> int:
+        st = os.stat(path)
+        conn = self._connect()
+        try:
+            # 多個 worker 同時匯入時以寫入鎖序列化，鎖內重新讀取位移，避免重複計算
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT head, head_len, size, offset, mtime FROM ingest_state WHERE dev = ? AND inode = ?',
+                               (st.st_dev, st.st_ino)).fetchone()
+            count = 0
+            with open(path, 'rb') as f:
+                offset = 0
+                settled = tail_settled(st)
+                if row is not None and st.st_size >= row['offset'] and zlib.crc32(f.read(row['head_len'])) == row['head']:
+                    if st.st_size == row['size'] and st.st_mtime == row['mtime'] and row['offset'] >= st.st_size:
+                        conn.rollback()
+                        return 0
+                    offset = row['offset']
+                    settled = tail_settled(st, row['size'], row['mtime'])
+                # 其餘情況（新檔、截斷、inode 被重複使用）從頭讀取；已計入的舊內容不扣除
+                stop = offset
+                if st.st_size > offset:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                        # 尚未寫完的最後一行留待檔案穩定後再匯入
+                        stop = complete_end(buf, offset, st.st_size, settled)
+                        if stop > offset:
+                            count = self._accumulate(conn, self.scan_range(buf, offset, stop))
+                f.seek(0)
+                head_len = min(stop, _HEAD_BYTES)
+                head = zlib.crc32(f.read(head_len))
+            if count:
+                self._prune(conn)
+            conn.execute(
+                'INSERT OR REPLACE INTO ingest_state (dev, inode, file, head, head_len, size, offset, mtime) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (st.st_dev, st.st_ino, os.path.basename(path), head, head_len, st.st_size, stop, st.st_mtime)
+            )
+            conn.commit()
+            return count
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _accumulate(self, conn: sqlite3.Connection, records) -> int:
+        """將 (位移, 記錄) 串流彙總到每秒 [請求數, 位元組, 2xx, 3xx, 4xx, 5xx, other] 後寫入各層級"""
+        seconds: Dict[int, List[int]] = {}
+        count = 0
+        for _, rec in records:
+            if _add_record(seconds, rec):
+                count += 1
+                if len(seconds) >= _FLUSH_SECONDS:
+                    self._upsert(conn, seconds)
+                    seconds = {}
+        if seconds:
+            self._upsert(conn, seconds)
+        return count
+
+    def _upsert(self, conn: sqlite3.Connection, seconds: Dict[int, List[int]]):
+        updates = ', '.join(f'{c} = {c} + excluded.{c}' for c in _COLUMNS)
+        for name, step in LEVELS:
+            if step == 1:
+                rolled = seconds
+            else:
+                rolled = {}
+                for ts, values in seconds.items():
+                    bucket = ts - ts % step
+                    slot = rolled.get(bucket)
+                    if slot is None:
+                        rolled[bucket] = list(values)
+                    else:
+                        for i, v in enumerate(values):
+                            slot[i] += v
+            conn.executemany(
+                f'INSERT INTO ts_{name} (bucket, {", ".join(_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                f'ON CONFLICT(bucket) DO UPDATE SET {updates}',
+                [(bucket,) + tuple(values) for bucket, values in rolled.items()]
+            )
+
+    def _prune(self, conn: sqlite3.Connection):
+        """依保留期間刪除各層級的舊資料點，並記錄該層級可回答的最早時間"""
+        for name, step in LEVELS:
+            keep = self.retention.get(name) or 0
+            if not keep:
+                continue
+            newest = conn.execute(f'SELECT MAX(bucket) FROM ts_{name}').fetchone()[0]
+            if newest is None:
+                continue
+            cutoff = newest - keep + step
+            conn.execute(f'DELETE FROM ts_{name} WHERE bucket < ?', (cutoff,))
+            conn.execute(
+                'INSERT INTO level_state (level, pruned_before) VALUES (?, ?) '
+                'ON CONFLICT(level) DO UPDATE SET pruned_before = MAX(pruned_before, excluded.pruned_before)',
+                (name, cutoff)
+            )
+
+    # ---- 查詢 ----
+
+    def levels(self) -> List[Dict[str, Any]]:
+        """各層級的資料點數、首末時間、保留期間與可回答的最早時間"""
+        result = []
+        with closing(self._connect()) as conn:
+            pruned = {r['level']: r['pruned_before'] for r in conn.execute('SELECT level, pruned_before FROM level_state')}
+            for name, step in LEVELS:
+                r = conn.execute(f'SELECT COUNT(*) AS n, MIN(bucket) AS t0, MAX(bucket) AS t1 FROM ts_{name}').fetchone()
+                result.append({
+                    'level': name,
+                    'seconds': step,
+                    'points': int(r['n']),
+                    'start': iso_utc(r['t0']) if r['t0'] is not None else None,
+                    'end': iso_utc(r['t1']) if r['t1'] is not None else None,
+                    'retention_seconds': self.retention.get(name) or 0,
+                    'available_from': iso_utc(pruned[name]) if pruned.get(name) is not None else None,
+                })
+        return result
+
+    def _choose_level(self, conn: sqlite3.Connection, start: int, step: int) -> Tuple[str, int, int]:
+        """挑選保留期間涵蓋 start、且能整除步長的最粗層級（讀取點數最少）；
+        沒有可整除的層級時改用涵蓋 start 的最細層級，步長放大為其整數倍"""
+        pruned = {r['level']: r['pruned_before'] for r in conn.execute('SELECT level, pruned_before FROM level_state')}
+        usable = [(n, s) for n, s in LEVELS if pruned.get(n) is None or start >= pruned[n]] or [LEVELS[-1]]
+        dividing = [(n, s) for n, s in usable if s <= step and step % s == 0]
+        name, seconds = dividing[-1] if dividing else usable[0]
+        if step % seconds:
+            step = seconds * -(-step // seconds)
+        return name, seconds, step
+
+    def series(self, start: int = None, end: int = None, step: int = None, max_points: int = 2000) -> Dict[str, Any]:
+        """回傳 [start, end]（UTC epoch 秒）間以 step 秒為級距的流量資料點
+
+        未指定 step 時依 max_points 自動選擇；起訖未指定時使用資料的首末時間。
+        """
+        with closing(self._connect()) as conn:
+            coarse = LEVELS[-1][0]
+            if start is None or end is None:
+                r = conn.execute(f'SELECT MIN(bucket) AS t0, MAX(bucket) AS t1 FROM ts_{coarse}').fetchone()
+                if r['t0'] is None:
+                    return {'level': None, 'step': step, 'start': None, 'end': None, 'points': []}
+                if start is None:
+                    start = r['t0']
+                if end is None:
+                    fine = conn.execute(f'SELECT MAX(bucket) FROM ts_{LEVELS[0][0]}').fetchone()[0]
+                    end = fine if fine is not None else r['t1'] + 86399
+            if step is None:
+                step = nice_step(end - start + 1, max_points)
+            level, seconds, step = self._choose_level(conn, start, max(int(step), 1))
+            rows = conn.execute(
+                f'SELECT (bucket / ?) * ? AS t, ' + ', '.join(f'SUM({c}) AS {c}' for c in _COLUMNS) +
+                f' FROM ts_{level} WHERE bucket >= ? AND bucket <= ? GROUP BY t ORDER BY t',
+                (step, step, start - start % seconds, end)
+            ).fetchall()
+        return {
+            'level': level,
+            'step': step,
+            'start': iso_utc(start),
+            'end': iso_utc(end),
+            'points': [_point(r['t'], [r[c] for c in _COLUMNS]) for r in rows],
+        }
@@ -0,0 +1,70 @@
+import re
+import json
+from functools import lru_cache
+from typing import List, Dict, Optional
+
+
+_NUMERIC = re.compile(r'^\d+$')
+_UUID = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+_HEX_HASH = re.compile(r'^[0-9a-fA-F]{16,}$')
+
+
+def load_route_rules(path: str) -> List[Dict[str, str]]:
+    """讀取路由規則 JSON：[{"pattern": "^/user/[^/]+/profile$", "route": "/user/:name/profile"}, ...]"""
+    with open(path, 'r', encoding='utf-8') as f:
+        rules = json.load(f)
+    if not isinstance(rules, list):
+        raise ValueError('路由規則必須是陣列')
+    for rule in rules:
+        if 'pattern' not in rule or 'route' not in rule:
+            raise ValueError(f'路由規則缺少 pattern/route: {rule}')
+    return rules
+
+
+class UrlNormalizer:
+    """將原始 URL 正規化為路由樣板以限制基數
+
+    - 查詢參數：'mask'（預設）保留排序後的參數名稱、值改為 *；'strip' 全部移除；'keep' 保持原樣
+    - 路徑片段：純數字 -> :id、UUID -> :uuid、16 位以上十六進位 -> :hash
+    - 使用者規則（正則 -> 路由）優先於內建規則，第一條符合者生效
+    結果依原始 URL 以 LRU 快取，相同 URL 只計算一次並共用同一個字串物件。
+    """
+
+    def __init__(self, query_mode: str = 'mask', rules: Optional[List[Dict[str, str]]] = None,
+                 cache_size: int = 65536):
+        if query_mode not in ('mask', 'strip', 'keep'):
+            raise ValueError(f'不支援的查詢參數模式: {query_mode}')
+        self.query_mode = query_mode
+        self.rules = [(re.compile(r['pattern']), r['route']) for r in (rules or [])]
+        self.normalize = lru_cache(maxsize=cache_size)(self._normalize)
+
+    def _normalize(self, url: Optional[str]) -> Optional[str]:
+        if url is None:
+            return None
+        path, _, query = url.partition('?')
+        path = path.split('#', 1)[0]
+
+        for pattern, route in self.rules:
+            if pattern.search(path):
+                return route
+
+        segments = path.split('/')
+        for i, seg in enumerate(segments):
+            if not seg:
+                continue
+            if _NUMERIC.match(seg):
+                segments[i] = ':id'
+            elif _UUID.match(seg):
+                segments[i] = ':uuid'
+            elif _HEX_HASH.match(seg):
+                segments[i] = ':hash'
+        route = '/'.join(segments)
+
+        if query and self.query_mode != 'strip':
+            if self.query_mode == 'keep':
+                route += '?' + query
+            else:
+                names = sorted({p.split('=', 1)[0] for p in query.split('&') if p})
+                if names:
+                    route += '?' + '&'.join(f'{n}=*' for n in names)
+        return route